@@ -0,0 +1,193 @@
+import cv2
+import imghash
+import mediaoutput
+import numpy as np
+import os
+import struct
+import threading
+
+MAGIC = 'SLAR'
+VERSION = 1
+EXTENSION = '.slar'
+
+# magic, version, file format of the images
+HEADER = struct.Struct('<4sH8s')
+# frame, fingerprint, offset and length of the image, length of the times
+ENTRY = struct.Struct('<qQQIH')
+# offset of the index, number of entries, magic
+FOOTER = struct.Struct('<QI4s')
+
+
+def is_archive(path):
+    """
+    Checks if the path denotes a slide archive.
+    :param path: the path of a file or directory
+    :return: whether or not the path is a slide archive
+    """
+    return path is not None and path.lower().endswith(EXTENSION)
+
+
+class SlideArchiveWriter(mediaoutput.MediaWriter):
+    """
+    The SlideArchiveWriter stores slides in a single file instead of one
+    image file per slide. The file contains the encoded images one after
+    another, followed by an index with the frame number, the timestamps,
+    the perceptual hash and the location of each image. The index is
+    written when the writer is closed.
+    """
+
+    def __init__(self, path, fps=None, file_format='.png', params=None):
+        """
+        Default initializer
+        :param path: where the archive should be stored
+        :param fps: the number of frames per second in the original
+        stream, used to derive the timestamps in write
+        :param file_format: the file format of the images
+        :param params: the encoding parameters, see
+        mediaoutput.encoding_params
+        """
+        if not file_format.startswith('.'):
+            file_format = '.' + file_format
+        self.file_format = mediaoutput.normalize_format(file_format)
+        self.params = params
+        self.name_getter = None
+        if fps is not None:
+            self.name_getter = mediaoutput.TimestampImageWriter(fps)
+        mediaoutput.setup_dirs(path)
+        self.archive = open(path, 'wb')
+        self.archive.write(HEADER.pack(MAGIC, VERSION, self.file_format))
+        self.entries = []
+
+    def write(self, img, *args):
+        """
+        Adds an image detected at the given frame to the archive.
+        :param img: the image or EncodedImage
+        :param args: the frame the image was detected at
+        """
+        frame = args[0]
+        self.add(img, self.name_getter.next_name([frame]), frame)
+
+    def add(self, img, time, frame=-1, times=(), encoded=None):
+        """
+        Adds an image to the archive.
+        :param img: the image
+        :param time: the timestamp of the image
+        :param frame: the frame number of the image, -1 if unknown
+        :param times: the additional timestamps of the image
+        :param encoded: an optional EncodedImage of the image
+        """
+        if isinstance(img, mediaoutput.EncodedImage):
+            encoded = img
+            img = img.decode()
+        encoded = mediaoutput.encode(encoded if encoded is not None else img, self.file_format, self.params)
+        offset = self.archive.tell()
+        self.archive.write(encoded.data)
+        text = ' '.join([time] + list(times)).encode('utf-8')
+        self.entries.append((frame, imghash.dhash(img), offset, len(encoded.data), text))
+
+    def close(self):
+        if self.archive.closed:
+            return
+        index_offset = self.archive.tell()
+        for frame, fingerprint, offset, length, text in self.entries:
+            self.archive.write(ENTRY.pack(frame, fingerprint, offset, length, len(text)))
+            self.archive.write(text)
+        self.archive.write(FOOTER.pack(index_offset, len(self.entries), MAGIC))
+        self.archive.close()
+
+
+class TimetableArchiveWriter(SlideArchiveWriter):
+    """
+    Stores the sorted slides in an archive like the TimetableWriter, the
+    appearances of each slide are kept in its timestamps.
+    """
+
+    def __init__(self, path, file_format='.png', params=None):
+        super(TimetableArchiveWriter, self).__init__(path, None, file_format, params)
+        self.appearances = []
+
+    def write(self, slides, *args):
+        """
+        Adds the images of the given slides right away. Their
+        appearances are put into the index on close, as later
+        duplicates still add to them.
+        :param slides: the sorted slides, marked duplicates are skipped
+        """
+        for slide in slides:
+            if slide.marked:
+                continue
+            self.add(slide.img, slide.time, encoded=slide.encoded)
+            self.appearances.append((len(self.entries) - 1, slide.time, slide.times))
+
+    def close(self):
+        if self.archive.closed:
+            return
+        for i, time, times in self.appearances:
+            text = ' '.join([time] + list(times)).encode('utf-8')
+            self.entries[i] = self.entries[i][:4] + (text,)
+        super(TimetableArchiveWriter, self).close()
+
+
+class SlideArchive(object):
+    """
+    Reads the slides of an archive written by the SlideArchiveWriter.
+    The images are addressed by their index in the archive, so that it
+    can be used in place of an ImageReader.
+    """
+
+    def __init__(self, path, flags=cv2.IMREAD_COLOR):
+        """
+        Default initializer
+        :param path: the path of the archive
+        :param flags: the flags passed to cv2.imdecode
+        """
+        self.path = path
+        self.flags = flags
+        self.lock = threading.Lock()
+        self.archive = open(path, 'rb')
+        magic, version, file_format = HEADER.unpack(self.archive.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise IOError("%s is not a slide archive" % path)
+        self.file_format = file_format.rstrip('\0')
+
+        self.archive.seek(-FOOTER.size, os.SEEK_END)
+        index_offset, count, magic = FOOTER.unpack(self.archive.read(FOOTER.size))
+        if magic != MAGIC:
+            raise IOError("the slide archive %s is incomplete" % path)
+        self.archive.seek(index_offset)
+        self.entries = []
+        for _ in xrange(count):
+            frame, fingerprint, offset, length, text_length = ENTRY.unpack(self.archive.read(ENTRY.size))
+            times = self.archive.read(text_length).decode('utf-8').split(' ')
+            self.entries.append((frame, fingerprint, offset, length, times))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get_encoded(self, index):
+        """
+        Returns the image at the index as it is stored in the archive.
+        :param index: the index of the slide
+        :return: the EncodedImage
+        """
+        _, _, offset, length, _ = self.entries[index]
+        with self.lock:
+            self.archive.seek(offset)
+            data = self.archive.read(length)
+        return mediaoutput.EncodedImage(data, self.file_format)
+
+    def get_img(self, index):
+        encoded = self.get_encoded(index)
+        return cv2.imdecode(np.frombuffer(encoded.data, dtype=np.uint8), self.flags)
+
+    def get_times(self, index):
+        return self.entries[index][4]
+
+    def get_frame(self, index):
+        return self.entries[index][0]
+
+    def get_fingerprint(self, index):
+        return self.entries[index][1]
+
+    def close(self):
+        self.archive.close()
@@ -1,12 +1,18 @@
 # -*- coding: utf-8 -*-
 
+import archive
 import argparse
 import cv2
+import multiprocessing
+import numpy as np
 import imgcomparison
+import imgprocessor
+import scenechange
 import timeline
 import mediaoutput
 import ui
 
+from collections import deque
 from slides import Slide
 from analyzer import Analyzer
 
@@ -43,15 +49,137 @@ class InfiniteCounter(object):
             self.current += self.step
 
 
+class SimilaritySignal(object):
+    """
+    Tracks the similarity of each frame to the first frame of its
+    segment, the anchor, and decides which frames are stable. The
+    threshold adapts to the noise of the video: the median similarity
+    of the recent frames tells how far static frames are from their
+    anchor, and the fixed threshold is lowered by that distance, but
+    never below the floor. On clean video the
+    median is 1 and the fixed threshold applies unchanged. Recordings
+    whose static frames never reach the fixed threshold, e.g. because
+    of camera noise, still settle this way.
+    """
+
+    def __init__(self, threshold, window=25, floor=0.9):
+        """
+        Default initializer
+        :param threshold: the fixed similarity threshold
+        :param window: the number of recent frames the median is taken
+        of. Transitions are short compared to it and do not move the
+        median.
+        :param floor: the lowest threshold
+        """
+        self.fixed = threshold
+        self.floor = floor
+        self.history = deque(maxlen=window)
+
+    def threshold(self):
+        if len(self.history) < self.history.maxlen:
+            return self.fixed
+        noise = 1 - np.median(self.history)
+        return max(self.floor, self.fixed - noise)
+
+    def is_stable(self, similarity):
+        """
+        Adds the similarity of the next frame to the anchor of its
+        segment.
+        :return: whether the frame is stable
+        """
+        stable = similarity >= self.threshold()
+        self.history.append(similarity)
+        return stable
+
+
 class Detector(Analyzer):
 
-    def __init__(self, device, outpath=None, fileformat=".png"):
+    def __init__(self, device, outpath=None, fileformat=".png", fingerprint=None, stride=1,
+                 keyframe_interval=None, prefetch=0, jobs=1, write_workers=0, encoding_params=None,
+                 region=None, reuse_buffers=False, stable_frames=0, scene_threshold=None):
+        """
+        Default initializer
+        :param device: the video device number or path to a video file
+        :param outpath: where the detected slides should be written.
+        Paths ending with '.slar' are written as a single slide archive.
+        :param fileformat: the file format of the written slides
+        :param fingerprint: optional (width, height) tuple. If given,
+        transitions are detected on downscaled grayscale fingerprints
+        of the frames instead of the full resolution frames.
+        :param stride: only every n-th frame is compared. Transitions
+        between two samples are located exactly through bisection. A
+        stride smaller than 1 samples once per second of video.
+        Strides larger than 1 require a seekable video file.
+        :param keyframe_interval: the approximate distance between two
+        keyframes of the video, see Timeline.
+        :param prefetch: the number of frames decoded ahead in a
+        background thread. 0 decodes on demand.
+        :param jobs: the number of processes scanning the video in
+        parallel. Each process scans its own range of frames with every
+        frame being compared, so the stride does not apply. Requires a
+        seekable video file.
+        :param write_workers: the number of threads writing the slides
+        in the background. 0 writes them synchronously.
+        :param encoding_params: the OpenCV encoding parameters of the
+        written slides, see mediaoutput.encoding_params
+        :param region: the region of the frames showing the slide as
+        (x, y, width, height) tuple. Only this region is compared. If
+        "auto", it is detected from the first minutes of the video.
+        :param reuse_buffers: decode the frames alternately into two
+        preallocated buffers and compare them without allocating. Only
+        the frame by frame scans use the buffers, sampling with a
+        stride bisects over older frames and allocates as before.
+        :param stable_frames: if greater than 0, a slide is only
+        detected after this many consecutive frames stayed the same,
+        with an adaptive threshold, see SimilaritySignal. Animations,
+        fades and embedded videos then result in a single slide. The
+        video is scanned frame by frame, stride and jobs do not apply.
+        :param scene_threshold: if given, ffmpeg searches candidate
+        transitions with its scene detection first, using this scene
+        score threshold, and only the frames around the candidates are
+        decoded, see scenechange.scene_changes. Stride and jobs do not
+        apply. Requires a video file and ffmpeg.
+        """
+        self.device = device
+        self.fingerprint_size = fingerprint
+        self.jobs = jobs
         cap = cv2.VideoCapture(sanitize_device(device))
-        self.sequence = timeline.Timeline(cap)
+        if prefetch > 0:
+            self.sequence = timeline.PrefetchTimeline(cap, prefetch, keyframe_interval)
+        else:
+            self.sequence = timeline.Timeline(cap, keyframe_interval)
         self.writer = mediaoutput.NullWriter()
-        if outpath is not None:
-            self.writer = mediaoutput.TimestampImageWriter(self.sequence.fps, outpath, fileformat)
-        self.comparator = imgcomparison.AbsDiffHistComparator(0.99)
+        if archive.is_archive(outpath):
+            self.writer = archive.SlideArchiveWriter(outpath, self.sequence.fps, fileformat, encoding_params)
+        elif outpath is not None:
+            self.writer = mediaoutput.TimestampImageWriter(self.sequence.fps, outpath, fileformat, encoding_params)
+            if write_workers > 0:
+                self.writer = mediaoutput.AsyncWriter(self.writer, write_workers)
+        if stride < 1:
+            stride = int(round(self.sequence.fps))
+        self.stride = max(1, stride)
+        self.reuse_buffers = reuse_buffers
+        self.frame_buffers = None
+        if reuse_buffers:
+            self.comparator = imgcomparison.BufferedAbsDiffComparator(0.99)
+            self.frame_buffers = [None, None]
+        else:
+            self.comparator = imgcomparison.AbsDiffHistComparator(0.99)
+        # the fingerprint buffers alternate like the frame buffers
+        self.processors = imgprocessor.ImageProcessQueue(reuse=reuse_buffers and self.stride == 1)
+        if region == 'auto':
+            region = self.detect_region()
+        self.region = region
+        if region is not None:
+            self.processors.add(imgprocessor.CropProcessor(region))
+        if fingerprint is not None:
+            self.processors.add(imgprocessor.ResizeProcessor(fingerprint))
+            self.processors.add(imgprocessor.GrayscaleProcessor())
+        self.encoded = None
+        self.stable_frames = stable_frames
+        if scene_threshold is not None and isinstance(sanitize_device(device), int):
+            raise ValueError("the scene change prefilter requires a video file")
+        self.scene_threshold = scene_threshold
 
     def detect_slides(self):
         progress = ui.ProgressController('Analyzing Video: ', self.sequence.len)
@@ -61,44 +189,498 @@ class Detector(Analyzer):
         for i, frame in self.check_transition():
             progress.update(i)
             if frame is not None:
-                frames.append(Slide(name_getter.next_name([i]), frame))
+                slide = Slide(name_getter.next_name([i]), frame)
+                slide.encoded = self.encoded
+                frames.append(slide)
 
         progress.finish()
 
         self.sequence.release_stream()
+        self.writer.close()
         return frames
 
+    def detect_region(self, seconds=120):
+        """
+        Detects the region showing the slide from one frame per second
+        of the beginning of the video, see
+        imgprocessor.detect_slide_region.
+        :param seconds: the number of seconds that are sampled
+        :return: the region as (x, y, width, height) tuple
+        """
+        region = imgprocessor.detect_slide_region(self.sample_frames(seconds))
+        self.sequence.seek(0)
+        return region
+
+    def sample_frames(self, seconds):
+        """
+        Reads one frame per second from the beginning of the video.
+        :param seconds: the number of seconds that are sampled
+        :return: generator of the frames
+        """
+        step = max(1, int(round(self.sequence.fps)))
+        for _ in xrange(seconds):
+            frame = self.sequence.next_frame()
+            if frame is None or not self.sequence.skip(step - 1):
+                return
+            yield frame
+
+    def write_slide(self, frame, frame_count):
+        """
+        Writes a detected slide. When it is written synchronously, the
+        slide is encoded only once and the encoding is kept in
+        self.encoded, so that later stages can reuse it.
+        :param frame: the frame showing the slide
+        :param frame_count: the position of the slide in the video
+        """
+        self.encoded = None
+        if isinstance(self.writer, mediaoutput.ImageWriter):
+            self.encoded = self.writer.encode(frame)
+            self.writer.write(self.encoded, frame_count)
+        else:
+            self.writer.write(frame, frame_count)
+
+    def next_frame(self):
+        """
+        Reads the next frame of the scans. With reused buffers a frame
+        stays valid until the next but one call, see keep.
+        :return: the frame or None at the end of the stream
+        """
+        if self.frame_buffers is None:
+            return self.sequence.next_frame()
+        self.frame_buffers.reverse()
+        frame = self.sequence.read_into(self.frame_buffers[0])
+        if frame is not None:
+            self.frame_buffers[0] = frame
+        return frame
+
+    def keep(self, frame):
+        """
+        Returns a frame that may be handed out to the writer and the
+        caller. With reused buffers this is a copy of the frame.
+        """
+        if self.frame_buffers is None:
+            return frame
+        return frame.copy()
+
+    def fingerprint(self, frame):
+        """
+        Returns the representation of the frame the comparator works
+        on. Without a fingerprint size this is the frame itself.
+        :param frame: the full resolution frame
+        :return: the fingerprint of the frame
+        """
+        return self.processors.apply(frame)
+
     def check_transition(self):
-        prev_frame = self.sequence.next_frame()
-        self.writer.write(prev_frame, 0)
+        if self.stable_frames > 0:
+            return self.stable_transitions()
+        if self.scene_threshold is not None:
+            return self.prefiltered_transitions()
+        if self.jobs > 1 and self.sequence.len > 0:
+            return self.parallel_transitions()
+        if self.stride > 1:
+            return self.sample_transitions()
+        return self.scan_transitions()
+
+    def scan_transitions(self):
+        prev_frame = self.next_frame()
+        prev_print = self.fingerprint(prev_frame)
+        prev_frame = self.keep(prev_frame)
+        self.write_slide(prev_frame, 0)
         yield 0, prev_frame
 
         frame_counter = InfiniteCounter()
         for frame_count in frame_counter.count():
 
-            frame = self.sequence.next_frame()
+            frame = self.next_frame()
 
             if frame is None:
                 break
-            elif not self.comparator.are_same(prev_frame, frame):
+
+            fprint = self.fingerprint(frame)
+            if not self.comparator.are_same(prev_print, fprint):
 
                 while True:
-                    if self.comparator.are_same(prev_frame, frame):
+                    if self.comparator.are_same(prev_print, fprint):
                         break
-                    prev_frame = frame
-                    frame = self.sequence.next_frame()
+                    prev_print = fprint
+                    frame = self.next_frame()
+                    if frame is None:
+                        return
+                    fprint = self.fingerprint(frame)
                     frame_counter.increment()
-                self.writer.write(frame, frame_count)
+                frame = self.keep(frame)
+                self.write_slide(frame, frame_count)
                 yield frame_count, frame
 
-            prev_frame = frame
+            prev_print = fprint
 
             yield frame_count, None
 
+    def stable_transitions(self):
+        """
+        Splits the video into stable segments, i.e. runs of frames that
+        stay the same for at least stable_frames frames, and emits one
+        slide per segment unless it shows the same as the previous
+        slide. The frames in between, e.g. of animations, are ignored.
+        Each frame is compared with the first frame of its segment
+        rather than with its predecessor, and within a settled segment
+        also with the last slide, so that slow fades whose consecutive
+        frames barely differ still end the segment.
+        """
+        signal = SimilaritySignal(self.comparator.threshold)
+        frame = self.next_frame()
+        if frame is None:
+            return
+        prev_print = self.fingerprint(frame)
+        anchor = prev_print.copy()
+        slide_print = None
+        # whether the current segment has been compared with the slides
+        settled = False
+        # the first frame that changed since the last settled segment
+        transition_start = 0
+        stable = 0
+        pos = 0
+
+        while True:
+            if stable >= self.stable_frames and not settled:
+                settled = True
+                if slide_print is None or \
+                        self.comparator.are_similar(slide_print, prev_print) < signal.threshold():
+                    slide_print = prev_print.copy()
+                    frame_count = max(0, transition_start - 1)
+                    frame = self.keep(frame)
+                    self.write_slide(frame, frame_count)
+                    yield frame_count, frame
+
+            frame = self.next_frame()
+            if frame is None:
+                break
+            pos += 1
+
+            fprint = self.fingerprint(frame)
+            changed = not signal.is_stable(self.comparator.are_similar(anchor, fprint))
+            if not changed and settled:
+                # the frame drifted away from the slide of the segment
+                changed = self.comparator.are_similar(slide_print, fprint) < signal.threshold()
+            if changed:
+                if settled:
+                    transition_start = pos
+                stable = 0
+                settled = False
+                anchor = fprint.copy()
+            else:
+                stable += 1
+            prev_print = fprint
+
+            yield pos, None
+
+    def prefiltered_transitions(self):
+        """
+        Only decodes the frames around the scene changes ffmpeg found.
+        Each candidate is scanned frame by frame from one second before
+        up to one second after it, so that candidates a few frames off
+        do not matter. Overlapping windows are scanned only once.
+
+        Before each window, and at the end of the video, the last frame
+        that was not decoded is compared with the last slide, so that
+        changes ffmpeg missed are still found one after another through
+        bisection. After each window its last frame is compared with the
+        last slide as well, as the scan does not notice gradual
+        transitions like slow fades.
+        """
+        first_frame = self.sequence.get_frame(0)
+        self.write_slide(first_frame, 0)
+        yield 0, first_frame
+        slide_print = self.fingerprint(first_frame).copy()
+
+        times = scenechange.scene_changes(self.device, self.scene_threshold)
+        margin = max(1, int(round(self.sequence.fps)))
+        windows = [(candidate - margin, candidate + margin + 1)
+                   for candidate in scenechange.candidate_frames(times, self.sequence.fps)]
+        if self.sequence.len > 0:
+            length = int(self.sequence.len)
+            windows = [(start, min(end, length)) for start, end in windows if start < length - 1]
+            windows.append((length - 1, None))
+        # position of the last frame that has been read, it shows the
+        # slide of slide_print
+        last_read = 0
+        for start, end in windows:
+            if end is not None and end <= last_read + 1:
+                continue
+            start = max(last_read + 1, start)
+
+            gap_end = start - 1
+            if gap_end > last_read and self.sequence.get_frame(gap_end) is None:
+                # the frame count of the video is too high
+                gap_end = self.last_frame(last_read, gap_end)
+            while gap_end > last_read:
+                reference = self.sequence.get_frame(gap_end)
+                if self.comparator.are_same(slide_print, self.fingerprint(reference)):
+                    break
+                # the slide changed between the windows
+                settled = self.follow_change(last_read, slide_print, gap_end, margin)
+                if settled is None:
+                    return
+                frame_count, last_read, frame, slide_print = settled
+                self.write_slide(frame, frame_count)
+                yield frame_count, frame
+            if gap_end < start - 1:
+                return
+            start = max(start, last_read + 1)
+            if end is not None and end <= start:
+                continue
+
+            transitions, last = self.scan_range(start, end)
+            # position of the last frame known to show the slide
+            matched = start - 1
+            for frame_count, settled_pos, frame in transitions:
+                slide_print = self.fingerprint(frame).copy()
+                matched = settled_pos
+                self.write_slide(frame, frame_count)
+                yield frame_count, frame
+            while last > matched:
+                reference = self.sequence.get_frame(last)
+                if self.comparator.are_same(slide_print, self.fingerprint(reference)):
+                    break
+                # a gradual transition the scan did not notice
+                settled = self.follow_change(matched, slide_print, last, margin)
+                if settled is None:
+                    return
+                frame_count, matched, frame, slide_print = settled
+                self.write_slide(frame, frame_count)
+                yield frame_count, frame
+            last_read = max(last_read, last, matched)
+            yield last_read, None
+
+    def follow_change(self, start, start_print, end, span):
+        """
+        Locates a change between two positions through bisection and
+        follows it until it settled.
+        :param start: a position showing the old slide
+        :param start_print: the fingerprint of the old slide
+        :param end: a position differing from the old slide
+        :param span: see follow_transition
+        :return: tuple of the frame count of the change, the position,
+        the frame and a copy of the fingerprint of the settled frame or
+        None if the stream ended before
+        """
+        first = self.bisect_transition(start, start_print, end)
+        settled = self.follow_transition(first, span)
+        if settled is None:
+            return None
+        pos, frame, fprint = settled
+        return first - 1, pos, frame, fprint.copy()
+
+    def last_frame(self, start, end):
+        """
+        Searches the last frame that can be read up to end, for videos
+        whose frame count is too high.
+        :param start: a position that can be read
+        :param end: a position behind start
+        :return: the position of the last frame that can be read
+        """
+        while end > start:
+            middle = (start + end + 1) // 2
+            if self.sequence.get_frame(middle) is None:
+                end = middle - 1
+            else:
+                start = middle
+        return start
+
+    def sample_transitions(self):
+        """
+        Compares only every n-th frame, where n is the stride. If two
+        samples differ, the exact frame of the transition is searched
+        through bisection between both samples. From there on the
+        transition is followed frame by frame until it settled, see
+        follow_transition. The settled frame is written and the
+        sampling resumes from it.
+        """
+        prev_frame = self.sequence.next_frame()
+        prev_print = self.fingerprint(prev_frame)
+        self.write_slide(prev_frame, 0)
+        yield 0, prev_frame
+
+        prev_pos = 0
+        while True:
+            step = self.stride
+            if self.sequence.len > 0:
+                step = max(1, min(step, int(self.sequence.len) - 1 - prev_pos))
+            pos = prev_pos + step
+
+            if not self.sequence.skip(step - 1):
+                break
+            frame = self.sequence.next_frame()
+            if frame is None:
+                break
+
+            fprint = self.fingerprint(frame)
+            if not self.comparator.are_same(prev_print, fprint):
+                frame_count = self.bisect_transition(prev_pos, prev_print, pos) - 1
+                settled = self.follow_transition(frame_count + 1, self.stride)
+                if settled is None:
+                    break
+                pos, frame, fprint = settled
+                self.write_slide(frame, frame_count)
+                yield frame_count, frame
+
+            prev_pos = pos
+            prev_print = fprint
+
+            yield pos, None
+
+    def follow_transition(self, pos, span):
+        """
+        Reads the frames from the given position on until a frame is
+        the same as the one span frames before it. Slow fades, whose
+        consecutive frames barely differ, are followed to their end
+        this way, so that the next sample does not differ again.
+        :param pos: the position of the first frame of the transition
+        :param span: the distance of the compared frames, the stride
+        :return: tuple of the position, the frame and the fingerprint
+        of the first settled frame or None if the stream ended before
+        """
+        self.sequence.move_to(pos)
+        prints = deque(maxlen=span)
+        while True:
+            frame = self.sequence.next_frame()
+            if frame is None:
+                return None
+            fprint = self.fingerprint(frame)
+            if len(prints) == span and self.comparator.are_same(prints[0], fprint):
+                return pos, frame, fprint
+            prints.append(fprint)
+            pos += 1
+
+    def bisect_transition(self, start, start_print, end):
+        """
+        Searches the first frame between start and end that differs
+        from the frame at start.
+        :param start: the position of a frame showing the old slide
+        :param start_print: the fingerprint of the frame at start
+        :param end: the position of a frame differing from start
+        :return: the position of the first differing frame
+        """
+        while end - start > 1:
+            middle = (start + end) // 2
+            self.sequence.move_to(middle)
+            frame = self.sequence.next_frame()
+            if frame is not None and self.comparator.are_same(start_print, self.fingerprint(frame)):
+                start = middle
+            else:
+                end = middle
+        return end
+
+    def scan_range(self, start, end=None):
+        """
+        Scans the frames from start up to end the same way
+        scan_transitions does, using the frame before start as the
+        reference. A transition beginning before end is followed beyond
+        end until it settled.
+        :param start: the position of the first frame to compare (>= 1)
+        :param end: the position where no new transitions may begin.
+        None scans until the end of the stream.
+        :return: the list of (frame count, settle position, frame)
+        tuples of the found transitions and the position of the last
+        frame that has been read.
+        """
+        transitions = []
+        pos = start - 1
+        self.sequence.seek(pos)
+        prev_frame = self.next_frame()
+        if prev_frame is None:
+            return transitions, pos
+        prev_print = self.fingerprint(prev_frame)
+
+        while end is None or pos + 1 < end:
+            frame = self.next_frame()
+            if frame is None:
+                break
+            pos += 1
+
+            fprint = self.fingerprint(frame)
+            if not self.comparator.are_same(prev_print, fprint):
+                frame_count = pos - 1
+                while not self.comparator.are_same(prev_print, fprint):
+                    prev_print = fprint
+                    frame = self.next_frame()
+                    if frame is None:
+                        return transitions, pos
+                    pos += 1
+                    fprint = self.fingerprint(frame)
+                transitions.append((frame_count, pos, self.keep(frame)))
+
+            prev_print = fprint
+
+        return transitions, pos
+
+    def parallel_transitions(self):
+        """
+        Splits the video into one range of frames per job and scans
+        them in a process pool. The results are stitched in order, so
+        that they are identical to the ones of scan_transitions.
+        """
+        first_frame = self.sequence.get_frame(0)
+        self.write_slide(first_frame, 0)
+        yield 0, first_frame
+
+        length = int(self.sequence.len)
+        bounds = [1 + (length - 1) * i // self.jobs for i in xrange(self.jobs + 1)]
+        bounds[-1] = None
+        tasks = [(self.device, bounds[i], bounds[i + 1], self.fingerprint_size, self.region, self.reuse_buffers)
+                 for i in xrange(self.jobs)]
+
+        pool = multiprocessing.Pool(self.jobs)
+        try:
+            # position of the last frame the stitched result has seen
+            last_read = 0
+            for transitions, last in pool.imap(scan_chunk, tasks):
+                for frame_count, settled, frame in transitions:
+                    if settled <= last_read:
+                        continue
+                    if frame_count < last_read:
+                        # the transition was already in progress when the
+                        # previous range stopped reading behind its end
+                        if settled == last_read + 1:
+                            continue
+                        frame_count = last_read
+                    self.write_slide(frame, frame_count)
+                    yield frame_count, frame
+                last_read = max(last_read, last)
+                yield last_read, None
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
     def analyze(self):
-        for i, frame in self.check_transition():
-            time = mediaoutput.TimestampImageWriter(self.sequence.fps).next_name([i])
-            yield Slide(time, frame)
+        name_getter = mediaoutput.TimestampImageWriter(self.sequence.fps)
+        try:
+            for i, frame in self.check_transition():
+                if frame is not None:
+                    slide = Slide(name_getter.next_name([i]), frame)
+                    slide.encoded = self.encoded
+                    yield slide
+        finally:
+            self.sequence.release_stream()
+            self.writer.close()
+
+
+def scan_chunk(task):
+    """
+    Scans a range of frames of a video in its own process.
+    :param task: tuple of the video path, the start and end position
+    of the range, the fingerprint size, the region and whether to
+    reuse the frame buffers
+    :return: the result of Detector.scan_range
+    """
+    device, start, end, fingerprint, region, reuse_buffers = task
+    detector = Detector(device, fingerprint=fingerprint, region=region, reuse_buffers=reuse_buffers)
+    try:
+        return detector.scan_range(start, end)
+    finally:
+        detector.sequence.release_stream()
 
 
 def sanitize_device(device):
@@ -115,7 +697,35 @@ if __name__ == "__main__":
     Parser.add_argument("-o", "--outpath", help="path to output video file", default="slides/", nargs='?')
     Parser.add_argument("-f", "--fileformat", help="file format of the output images e.g. '.jpg'",
                         default=".jpg", nargs='?')
+    Parser.add_argument("--fingerprint", help="compare downscaled grayscale fingerprints of this size e.g. '160x90'",
+                        type=imgprocessor.parse_size, default=None)
+    Parser.add_argument("-s", "--stride", help="compare only every n-th frame, 0 samples once per second",
+                        type=int, default=1)
+    Parser.add_argument("-k", "--keyframe-interval", help="approximate number of frames between two keyframes",
+                        type=int, default=None)
+    Parser.add_argument("-p", "--prefetch", help="number of frames decoded ahead in a background thread",
+                        type=int, default=0)
+    Parser.add_argument("-j", "--jobs", help="number of processes scanning the video in parallel",
+                        type=int, default=1)
+    Parser.add_argument("--write-workers", help="number of threads writing the slides in the background",
+                        type=int, default=0)
+    Parser.add_argument("-c", "--compression", help="PNG compression level from 0 (fastest) to 9 (smallest)",
+                        type=int, default=None)
+    Parser.add_argument("-q", "--quality", help="JPEG or WebP quality from 0 to 100", type=int, default=None)
+    Parser.add_argument("-r", "--region", help="region of the slide as 'x,y,width,height' or 'auto'",
+                        type=imgprocessor.parse_region, default=None)
+    Parser.add_argument("--reuse-buffers", help="decode and compare the frames in preallocated buffers",
+                        action="store_true")
+    Parser.add_argument("--scene-threshold", help="only decode the frames around scene changes ffmpeg detects "
+                                                  "with this score e.g. 0.03", type=float, default=None)
+    Parser.add_argument("--stable-frames", help="emit one slide per run of at least this many unchanged frames",
+                        type=int, default=0)
     Args = Parser.parse_args()
 
-    detector = Detector(Args.device, Args.outpath, Args.fileformat)
+    detector = Detector(Args.device, Args.outpath, Args.fileformat, fingerprint=Args.fingerprint,
+                        stride=Args.stride, keyframe_interval=Args.keyframe_interval, prefetch=Args.prefetch,
+                        jobs=Args.jobs, write_workers=Args.write_workers,
+                        encoding_params=mediaoutput.encoding_params(Args.fileformat, Args.compression, Args.quality),
+                        region=Args.region, reuse_buffers=Args.reuse_buffers,
+                        stable_frames=Args.stable_frames, scene_threshold=Args.scene_threshold)
     detector.detect_slides()
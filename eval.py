@@ -1,21 +1,66 @@
 import argparse
+import csv
+import multiprocessing
+import time
+import numpy as np
 import imgcomparison as ic
 import imgprocessor as ip
 
-from levenshtein import ls
+from levenshtein import matrix_distance
 from slides import SlideDataHelper
 from slides import numericalSort
 
 class Evaluator(object):
-    def __init__(self, source, reference):
+    def __init__(self, source, reference, mmap=False, reduce=None, region=None):
         assert len(source) > 0
         assert len(reference) > 0
-        processor = ip.GrayscaleProcessor()
-        self.source = map(lambda x: processor.process(x.img), SlideDataHelper(source).get_slides())
-        self.reference = map(lambda x: processor.process(x.img), SlideDataHelper(reference).get_slides())
+        self.processors = ip.ImageProcessQueue()
+        if region is not None:
+            if reduce is not None:
+                # the region is given in full resolution coordinates
+                region = tuple(value // reduce for value in region)
+            self.processors.add(ip.CropProcessor(region))
+        self.processors.add(ip.GrayscaleProcessor())
+        self.comparator = ic.AbsDiffHistComparator(0.99)
+        # the reference slides are compared with every source slide and
+        # kept as grayscale images, the source slides are only decoded
+        # one at a time while the distance is computed
+        self.source = SlideDataHelper(source, lazy=True, mmap=mmap, reduce=reduce)
+        self.reference = self.load(SlideDataHelper(reference, lazy=True, mmap=mmap, reduce=reduce))
+        self.source_count = 0
+
+    def load(self, helper):
+        imgs = []
+        try:
+            for slide in helper.get_slides():
+                imgs.append(self.processors.apply(slide.img))
+        finally:
+            helper.close()
+        return imgs
+
+    def equal_matrix(self):
+        """
+        Compares each source slide with all reference slides as soon as
+        it is decoded.
+        :return: n x m boolean array telling whether the i-th source
+        slide is the same as the j-th reference slide
+        """
+        prepared = self.comparator.prepare_all(self.reference)
+        rows = []
+        try:
+            for slide in self.source.get_slides():
+                img = self.comparator.prepare(self.processors.apply(slide.img))
+                rows.append(self.comparator.batch_similarities(img, prepared) >= self.comparator.threshold)
+        finally:
+            self.source.close()
+        self.source_count = len(rows)
+        return np.array(rows, dtype=bool).reshape(len(rows), len(self.reference))
+
+    def distance(self):
+        return matrix_distance(self.equal_matrix())
     
     def compare(self):
-        lev_dist = ls(self.source, self.reference, ic.AbsDiffHistComparator(0.99).are_same)
+        lev_dist = self.distance()
         ser = lev_dist / float(len(self.reference))
 
         print("levenshtein distance: %d" % lev_dist)
@@ -23,18 +68,94 @@ class Evaluator(object):
         
         return ser
 
+
+RESULT_FIELDS = ['source', 'reference', 'distance', 'ser', 'seconds', 'slides_per_second']
+
+
+def evaluate(pair):
+    """
+    Evaluates a single pair of source and reference slides.
+    :param pair: tuple of the source and the reference directory and
+    the keyword arguments of the Evaluator
+    :return: dictionary with the fields in RESULT_FIELDS
+    """
+    source, ref, options = pair
+    start = time.time()
+    evaluator = Evaluator(source, ref, **options)
+    lev_dist = evaluator.distance()
+    elapsed = time.time() - start
+    slides = evaluator.source_count + len(evaluator.reference)
+    return {
+        'source': source,
+        'reference': ref,
+        'distance': lev_dist,
+        'ser': lev_dist / float(len(evaluator.reference)),
+        'seconds': elapsed,
+        'slides_per_second': slides / elapsed if elapsed > 0 else 0.0
+    }
+
+
+def evaluate_all(pairs, jobs=1, results_path=None, mmap=False, reduce=None, region=None):
+    """
+    Evaluates all pairs of source and reference slides, distributed
+    across a process pool.
+    :param pairs: the list of (source, reference) directory tuples
+    :param jobs: the number of pairs evaluated in parallel
+    :param results_path: optional path of a CSV file receiving one row
+    per pair
+    :param mmap: whether the decoded slides are kept in memory mapped
+    files, see SlideDataHelper
+    :param reduce: the factor by which the slides are reduced while
+    decoding, see SlideDataHelper
+    :param region: the region of the slides as (x, y, width, height)
+    tuple that is compared, in full resolution coordinates also when
+    the slides are reduced
+    :return: the list of results in the order of the pairs
+    """
+    options = {'mmap': mmap, 'reduce': reduce, 'region': region}
+    pairs = [(source, ref, options) for source, ref in pairs]
+    pool = None
+    if jobs > 1:
+        pool = multiprocessing.Pool(jobs)
+        outcomes = pool.imap(evaluate, pairs)
+    else:
+        outcomes = (evaluate(pair) for pair in pairs)
+
+    results = []
+    try:
+        for result in outcomes:
+            print result['source'], result['reference'], ":"
+            print("levenshtein distance: %d" % result['distance'])
+            print("slide error rate: %0.4f" % result['ser'])
+            results.append(result)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    if results_path is not None:
+        with open(results_path, 'wb') as results_file:
+            writer = csv.DictWriter(results_file, RESULT_FIELDS)
+            writer.writeheader()
+            writer.writerows(results)
+    return results
+
 if __name__ == "__main__":
     Parser = argparse.ArgumentParser(description="Evaluator")
     Parser.add_argument("-d", "--sourceslides", help="slides that needs to be evaluated", default="slides/", nargs='+')
     Parser.add_argument("-r", "--reference", help="reference slides that should be the proper outcome", nargs='+')
+    Parser.add_argument("-j", "--jobs", help="number of pairs evaluated in parallel", type=int, default=1)
+    Parser.add_argument("-o", "--results", help="path of a CSV file receiving the results of each pair", default=None)
+    Parser.add_argument("--mmap", help="keep the decoded slides in memory mapped files, in DIR for later runs "
+                                       "or temporary ones", nargs='?', const=True, default=False, metavar="DIR")
+    Parser.add_argument("--reduce", help="decode the slides as grayscale reduced by this factor (2, 4 or 8)",
+                        type=int, default=None)
+    Parser.add_argument("--region", help="region of the slides compared as 'x,y,width,height'",
+                        type=ip.parse_fixed_region, default=None)
     Args = Parser.parse_args()
     
     assert len(Args.sourceslides) == len(Args.reference)
     evaluations = zip(sorted(Args.sourceslides, key=numericalSort), sorted(Args.reference, key=numericalSort))
-    results = []
-    for (source, ref) in evaluations:
-        print source, ref, ":"
-        evaluator = Evaluator(source, ref)
-        results.append(evaluator.compare())
+    results = evaluate_all(evaluations, Args.jobs, Args.results, Args.mmap, Args.reduce, Args.region)
         
-    print(sum(results) / float(len(results)))
+    print(sum(result['ser'] for result in results) / float(len(results)))
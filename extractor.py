@@ -1,61 +1,221 @@
 import pyocr
 import pyocr.builders
-import subprocess
+import multiprocessing
 import mediaoutput
 import imgprocessor
 import ui
 import argparse
 import sources
 import codecs
-import tempfile
+import collections
 import os
+import StringIO
+
+from ocrcache import OCRCache
 
 from slides import SlideDataHelper
 from slides import convert_to_PIL
 from analyzer import Analyzer
 
-FNULL = open(os.devnull, 'w')
+# the OCR tool of a worker process, see init_worker
+worker_tool = None
+
+
+def get_tool():
+    ''' Returns the OCR tool, preferring the in-process libtesseract '''
+    tools = pyocr.get_available_tools()
+    for tool in tools:
+        if tool.__name__ == 'pyocr.libtesseract':
+            return tool
+    return tools[0]
+
+
+def settings(tool):
+    """ Describes the OCR settings that influence the result """
+    return '%s/%s/%s' % (tool.__name__, '.'.join(str(v) for v in tool.get_version()), 'LineBoxBuilder')
+
+
+def recognize(tool, img, lang):
+    """
+    Recognizes the text of an image in a single pass.
+    :param tool: the pyocr tool
+    :param img: the preprocessed image as PIL image
+    :param lang: the language of the text
+    :return: tuple of the plain text and the hOCR document
+    """
+    builder = pyocr.builders.LineBoxBuilder()
+    lines = tool.image_to_string(img, lang=lang, builder=builder)
+    hocr = StringIO.StringIO()
+    builder.write_file(hocr, lines)
+    text = u'\n'.join(line.content for line in lines)
+    return text, hocr.getvalue()
+
+
+def init_worker():
+    global worker_tool
+    worker_tool = get_tool()
+
+
+def recognize_task(task):
+    """
+    Recognizes the text of a slide in a worker process.
+    :param task: tuple of the slide number, the preprocessed image and
+    the language
+    :return: tuple of the slide number, the text and the hOCR document
+    """
+    count, processed, lang = task
+    text, hocr = recognize(worker_tool, convert_to_PIL(processed), lang)
+    return count, text, hocr
 
-def temp_file(suffix):
-    ''' Returns a temporary file '''
-    return tempfile.NamedTemporaryFile(prefix='tess_', suffix=suffix)
 
 class ContentExtractor(Analyzer):
 
-    def __init__(self, source, output_dir, lang="eng"):
+    def __init__(self, source, output_dir, lang="eng", jobs=1, cache=None, binarize=False, deskew=False):
+        """
+        Default initializer
+        :param source: the source of the slides
+        :param output_dir: where the text and hOCR of the slides are
+        written to
+        :param lang: the language of the slides
+        :param jobs: the number of processes recognizing slides in
+        parallel
+        :param cache: an optional OCRCache, slides found in it are not
+        recognized again
+        :param binarize: whether to binarize the slides before the
+        recognition
+        :param deskew: whether to straighten rotated text before the
+        recognition, implies binarize
+        """
         self.source = source
         self.output_dir = output_dir
-        self.recognizer = pyocr.get_available_tools()[0]
+        self.recognizer = get_tool()
         self.lang = lang
+        self.jobs = jobs
+        self.cache = cache
+        self.settings = settings(self.recognizer)
+        self.processors = imgprocessor.ImageProcessQueue()
+        self.processors.add(imgprocessor.GrayscaleProcessor())
+        if binarize or deskew:
+            self.processors.add(imgprocessor.BinarizeProcessor())
+        if deskew:
+            self.processors.add(imgprocessor.DeskewProcessor())
         mediaoutput.setup_dirs(self.output_dir)
 
     def analyze(self):
         progress = ui.ProgressController('Extracting Content: ', len(self.source))
         progress.start()
 
-        processors = imgprocessor.ImageProcessQueue()
-        processors.add(imgprocessor.GrayscaleProcessor())
-        count = 0
-        for slide in self.source.contents():
-            progress.update(count)
-            count += 1
-            self.extract(slide, processors, count)
+        if self.jobs > 1:
+            self.extract_parallel(self.processors, progress)
+        else:
+            count = 0
+            for slide in self.source.contents():
+                progress.update(count)
+                count += 1
+                self.extract(slide, self.processors, count)
         progress.finish()
+        if self.cache is not None:
+            print "OCR cache: %d hits, %d misses" % self.cache.stats()
 
     def extract(self, slide, processors, count):
         processed = processors.apply(slide.img)
-        processed = convert_to_PIL(processed)
-        image = temp_file('.bmp')
-        processed.save(image)
-        subprocess.call(['tesseract', '-l', self.lang, image.name, os.path.join(self.output_dir, '%d' % count), 'hocr'], stdout=FNULL, stderr=subprocess.STDOUT)
-        subprocess.call(['tesseract', '-l', self.lang, image.name, os.path.join(self.output_dir, '%d' % count)], stdout=FNULL, stderr=subprocess.STDOUT)
+        key = self.lookup(count, processed)
+        if key is False:
+            return slide
+        text, hocr = recognize(self.recognizer, convert_to_PIL(processed), self.lang)
+        self.store(key, count, text, hocr)
         return slide
 
+    def lookup(self, count, processed):
+        """
+        Looks up the OCR result of a preprocessed slide in the cache and
+        writes it if it is found.
+        :param count: the number of the slide
+        :param processed: the preprocessed image of the slide
+        :return: False if the result has been found, otherwise the key
+        of the result or None without cache
+        """
+        if self.cache is None:
+            return None
+        key = self.cache.key(processed, self.lang, self.settings)
+        result = self.cache.get(key)
+        if result is None:
+            return key
+        self.write(count, *result)
+        return False
+
+    def store(self, key, count, text, hocr):
+        """
+        Writes the OCR result of a slide and puts it into the cache.
+        """
+        self.write(count, text, hocr)
+        if key is not None:
+            self.cache.put(key, text, hocr)
+
+    def extract_parallel(self, processors, progress):
+        """
+        Recognizes the slides in a process pool. The slides are
+        preprocessed in this process and the results are written in
+        the order of the slides. At most two slides per process are
+        in flight at a time.
+        """
+        pool = multiprocessing.Pool(self.jobs, init_worker)
+        pending = collections.deque()
+        try:
+            for count, slide in enumerate(self.source.contents(), 1):
+                processed = processors.apply(slide.img)
+                key = self.lookup(count, processed)
+                if key is not False:
+                    task = (count, processed, self.lang)
+                    pending.append((key, pool.apply_async(recognize_task, (task,))))
+                    if len(pending) >= 2 * self.jobs:
+                        key, result = pending.popleft()
+                        self.store(key, *result.get())
+                # all but the pending slides are done, cache hits included
+                progress.update(count - len(pending))
+            while pending:
+                key, result = pending.popleft()
+                self.store(key, *result.get())
+                progress.update(count - len(pending))
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def write(self, count, text, hocr):
+        """
+        Writes the text and the hOCR document of a slide to disk.
+        :param count: the number of the slide
+        """
+        base = os.path.join(self.output_dir, '%d' % count)
+        with codecs.open(base + '.txt', 'w', encoding='utf-8') as text_file:
+            text_file.write(text)
+        with codecs.open(base + '.hocr', 'w', encoding='utf-8') as hocr_file:
+            hocr_file.write(hocr)
+
 if __name__ == "__main__":
     Parser = argparse.ArgumentParser(description="Slide Sorter")
     Parser.add_argument("-d", "--inputslides", help="path of the sequentially sorted slides", default="unique/")
     Parser.add_argument("-o", "--outpath", help="path to output the content of the slides", default="contents/", nargs='?')
     Parser.add_argument("-l", "--lang", help="language to be analyzed", default="eng", nargs='?')
+    Parser.add_argument("--lazy", help="decode the slides only when they are accessed", action="store_true")
+    Parser.add_argument("--mmap", help="keep the decoded slides in memory mapped files, in DIR for later runs "
+                                       "or temporary ones", nargs='?', const=True, default=False, metavar="DIR")
+    Parser.add_argument("-w", "--workers", help="number of threads decoding the slides", type=int, default=1)
+    Parser.add_argument("-j", "--jobs", help="number of processes recognizing slides in parallel", type=int, default=1)
+    Parser.add_argument("-c", "--cache", help="directory of the OCR cache", default=None)
+    Parser.add_argument("--cache-size", help="maximum size of the OCR cache in MB", type=int, default=512)
+    Parser.add_argument("--binarize", help="binarize the slides before recognizing them", action="store_true")
+    Parser.add_argument("--deskew", help="straighten rotated text before recognizing it, implies --binarize",
+                        action="store_true")
     Args = Parser.parse_args()
-    ContentExtractor(sources.ListSource(SlideDataHelper(Args.inputslides).get_slides()), Args.outpath, lang=Args.lang).analyze()
-
+    helper = SlideDataHelper(Args.inputslides, lazy=Args.lazy, mmap=Args.mmap, workers=Args.workers)
+    slides = helper.get_slides()
+    cache = None
+    if Args.cache is not None:
+        cache = OCRCache(Args.cache, Args.cache_size * 1024 * 1024)
+    try:
+        ContentExtractor(sources.ListSource(slides), Args.outpath, lang=Args.lang, jobs=Args.jobs, cache=cache,
+                         binarize=Args.binarize, deskew=Args.deskew).analyze()
+    finally:
+        helper.close()
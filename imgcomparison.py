@@ -2,8 +2,11 @@ import cv2
 import numpy as np
 from abc import ABCMeta, abstractmethod
 import operator
+import weakref
 import scipy.spatial.distance as dist
 
+from collections import OrderedDict
+
 
 class ImageComparator(object):
     __metaclass__ = ABCMeta
@@ -18,17 +21,204 @@ class ImageComparator(object):
     def are_same(self, first, second, op=operator.ge):
         return op(self.are_similar(first, second), self.threshold)
 
+    def prepare(self, img):
+        """
+        Returns the representation of an image the batch comparisons
+        work on. It only has to be computed once per image.
+        :param img: the image
+        :return: the representation of the image
+        """
+        return img
+
+    def prepare_all(self, imgs):
+        """
+        Returns the representations of several images.
+        :param imgs: the list of images
+        :return: the representations of the images
+        """
+        return [self.prepare(img) for img in imgs]
+
+    def batch_similarities(self, first, others):
+        """
+        Compares a prepared image against several prepared images.
+        Subclasses override this with a vectorized implementation.
+        :param first: the representation of the first image
+        :param others: the representations of the other images
+        :return: an array with the similarity to each of the others
+        """
+        return np.array([self.are_similar(first, other) for other in others], dtype=float)
+
+    def similarities(self, first, others):
+        """
+        Compares an image against each of the other images.
+        :param first: the image
+        :param others: the list or stacked array of other images
+        :return: an array with the similarity to each of the others
+        """
+        return self.batch_similarities(self.prepare(first), self.prepare_all(others))
+
+    def similarity_matrix(self, firsts, seconds):
+        """
+        Compares each of the first images against each of the second
+        images.
+        :param firsts: the list of n images
+        :param seconds: the list of m images
+        :return: n x m array of the similarities
+        """
+        prepared = self.prepare_all(seconds)
+        result = np.empty((len(firsts), len(seconds)))
+        for i, first in enumerate(firsts):
+            result[i] = self.batch_similarities(self.prepare(first), prepared)
+        return result
+
+    def same_matrix(self, firsts, seconds, op=operator.ge):
+        """
+        Same as similarity_matrix, but tells whether the images are
+        the same according to the threshold.
+        :return: n x m boolean array
+        """
+        return op(self.similarity_matrix(firsts, seconds), self.threshold)
+
+
+class FeatureCache(object):
+    """
+    Bounded cache of the representations of images, keyed by the
+    array owning the pixels and the location of the image in it. Views
+    that are created anew for every access, e.g. crops of a region or
+    slices of a memory mapped file, are found again this way. The
+    owning arrays are only referenced weakly, so the cache does not
+    keep them alive. Images must not be changed in place while they
+    are cached.
+    """
+
+    def __init__(self, size=256):
+        """
+        Default initializer
+        :param size: the maximum number of cached representations
+        """
+        self.size = size
+        self.entries = OrderedDict()
+
+    def get(self, img, compute):
+        """
+        Returns the cached representation of the image or computes it.
+        :param img: the image
+        :param compute: the function computing the representation
+        :return: the representation of the image
+        """
+        owner = img
+        while isinstance(owner.base, np.ndarray):
+            owner = owner.base
+        key = (id(owner), img.__array_interface__['data'][0], img.shape, img.strides)
+        entry = self.entries.pop(key, None)
+        if entry is None or entry[0]() is not owner:
+            entry = (weakref.ref(owner), compute(img))
+        if self.size > 0:
+            self.entries[key] = entry
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return entry[1]
+
+
+class RegionComparator(ImageComparator):
+    """
+    Compares only a region of interest of the images through another
+    comparator, e.g. the slide area of a picture-in-picture recording.
+    """
+
+    def __init__(self, comparator, region):
+        """
+        Default initializer
+        :param comparator: the comparator comparing the regions
+        :param region: the region as (x, y, width, height) tuple
+        """
+        super(RegionComparator, self).__init__(comparator.threshold)
+        self.comparator = comparator
+        self.region = region
+
+    def crop(self, img):
+        x, y, width, height = self.region
+        return img[y:y + height, x:x + width]
+
+    def are_similar(self, first, second):
+        return self.comparator.are_similar(self.crop(first), self.crop(second))
+
+    def prepare(self, img):
+        return self.comparator.prepare(self.crop(img))
+
+    def prepare_all(self, imgs):
+        return self.comparator.prepare_all([self.crop(img) for img in imgs])
+
+    def batch_similarities(self, first, others):
+        return self.comparator.batch_similarities(first, others)
+
 
 class AbsDiffHistComparator(ImageComparator):
 
-    def __init__(self, threshold):
+    def __init__(self, threshold, batch_size=16):
+        """
+        Default initializer
+        :param threshold: the similarity from which on two images are
+        the same
+        :param batch_size: the number of images compared at once in
+        the batch comparisons
+        """
         super(AbsDiffHistComparator, self).__init__(threshold)
+        self.batch_size = batch_size
 
     def are_similar(self, first, second):
         res = cv2.absdiff(first, second)
         hist = cv2.calcHist([res], [0], None, [256], [0, 256])
         return 1 - np.sum(hist[15::]) / np.sum(hist)
 
+    def prepare(self, img):
+        # the histogram only covers the first channel
+        if len(img.shape) == 3:
+            return img[:, :, 0]
+        return img
+
+    def prepare_all(self, imgs):
+        return np.array([self.prepare(img) for img in imgs])
+
+    def batch_similarities(self, first, others):
+        result = np.empty(len(others))
+        first = first.astype(np.int16)
+        for start in xrange(0, len(others), self.batch_size):
+            batch = np.asarray(others[start:start + self.batch_size]).astype(np.int16)
+            changed = np.abs(batch - first) >= 15
+            result[start:start + len(batch)] = changed.reshape(len(batch), -1).mean(axis=1)
+        return 1 - result
+
+
+class BufferedAbsDiffComparator(AbsDiffHistComparator):
+    """
+    Computes the same similarity as the AbsDiffHistComparator without
+    allocating per comparison. The difference is written into a
+    preallocated buffer and the changed pixels are counted directly
+    instead of building a histogram. An instance must not be shared
+    between threads.
+    """
+
+    def __init__(self, threshold, batch_size=16):
+        super(BufferedAbsDiffComparator, self).__init__(threshold, batch_size)
+        self.diff = None
+        self.channel = None
+
+    def are_similar(self, first, second):
+        if self.diff is None or self.diff.shape != first.shape:
+            self.diff = np.empty_like(first)
+            self.channel = np.empty(first.shape[:2], first.dtype)
+        cv2.absdiff(first, second, dst=self.diff)
+        channel = self.diff
+        if len(first.shape) == 3:
+            cv2.extractChannel(self.diff, 0, dst=self.channel)
+            channel = self.channel
+        # pixels above 14 are the ones in the histogram bins from 15 on
+        cv2.threshold(channel, 14, 255, cv2.THRESH_BINARY, dst=channel)
+        changed = cv2.countNonZero(channel)
+        # the histogram is summed up in single precision
+        return 1 - np.float32(changed) / np.float32(channel.size)
+
 
 class EuclideanComparator(ImageComparator):
 
@@ -38,6 +228,18 @@ class EuclideanComparator(ImageComparator):
     def are_similar(self, first, second):
         return dist.euclidean(first, second)
 
+    def prepare(self, img):
+        return np.asarray(img, dtype=float).ravel()
+
+    def prepare_all(self, imgs):
+        return np.array([self.prepare(img) for img in imgs])
+
+    def batch_similarities(self, first, others):
+        return dist.cdist([first], others, 'euclidean')[0]
+
+    def similarity_matrix(self, firsts, seconds):
+        return dist.cdist(self.prepare_all(firsts), self.prepare_all(seconds), 'euclidean')
+
 
 class ChebysevComparator(ImageComparator):
 
@@ -47,27 +249,80 @@ class ChebysevComparator(ImageComparator):
     def are_similar(self, first, second):
         return dist.chebyshev(first, second)
 
+    def prepare(self, img):
+        return np.asarray(img, dtype=float).ravel()
+
+    def prepare_all(self, imgs):
+        return np.array([self.prepare(img) for img in imgs])
+
+    def batch_similarities(self, first, others):
+        return dist.cdist([first], others, 'chebyshev')[0]
+
+    def similarity_matrix(self, firsts, seconds):
+        return dist.cdist(self.prepare_all(firsts), self.prepare_all(seconds), 'chebyshev')
+
 
 class OpenCVComparator(ImageComparator):
 
     __metaclass__ = ABCMeta
 
-    def __init__(self, threshold):
+    def __init__(self, threshold, cache_size=256):
+        """
+        Default initializer
+        :param threshold: the similarity from which on two images are
+        the same
+        :param cache_size: the number of images whose histograms are
+        kept for subsequent comparisons
+        """
         super(OpenCVComparator, self).__init__(threshold)
+        self.cache = FeatureCache(cache_size)
 
     @abstractmethod
     def get_technique(self):
         pass
 
     def are_similar(self, first, second):
-
-        result = 0
-        for i in xrange(3):
-            hist1 = cv2.calcHist([first], [i], None, [256], [0,256])
-            hist2 = cv2.calcHist([second], [i], None, [256], [0,256])
-            result += cv2.compareHist(hist1, hist2, self.get_technique())
-
-        return result / 3
+        return self.batch_similarities(self.prepare(first), [self.prepare(second)])[0]
+
+    def prepare(self, img):
+        return self.cache.get(img, self.histograms)
+
+    def histograms(self, img):
+        """
+        Computes the histograms of the three color channels of an image.
+        :param img: the image
+        :return: 3 x 256 array of the histograms
+        """
+        return np.array([cv2.calcHist([img], [i], None, [256], [0,256]).ravel() for i in xrange(3)], dtype=float)
+
+    def prepare_all(self, imgs):
+        return np.array([self.prepare(img) for img in imgs])
+
+    def batch_similarities(self, first, others):
+        others = np.asarray(others)
+        technique = self.get_technique()
+        if technique == cv2.HISTCMP_CORREL:
+            first = first - first.mean(axis=-1, keepdims=True)
+            others = others - others.mean(axis=-1, keepdims=True)
+            numerator = (first * others).sum(axis=-1)
+            denominator = (first * first).sum(axis=-1) * (others * others).sum(axis=-1)
+            safe = np.where(np.abs(denominator) > np.finfo(float).eps, denominator, 1)
+            result = np.where(np.abs(denominator) > np.finfo(float).eps, numerator / np.sqrt(safe), 1)
+        elif technique == cv2.HISTCMP_CHISQR:
+            nonzero = np.abs(first) > np.finfo(float).eps
+            safe = np.where(nonzero, first, 1)
+            result = np.where(nonzero, (first - others) ** 2 / safe, 0).sum(axis=-1)
+        elif technique == cv2.HISTCMP_INTERSECT:
+            result = np.minimum(first, others).sum(axis=-1)
+        elif technique == cv2.HISTCMP_BHATTACHARYYA:
+            scale = first.sum(axis=-1) * others.sum(axis=-1)
+            scale = np.where(np.abs(scale) > np.finfo(np.float32).eps, 1 / np.sqrt(np.abs(scale)), 1)
+            result = np.sqrt(np.maximum(1 - np.sqrt(first * others).sum(axis=-1) * scale, 0))
+        else:
+            result = np.array([[cv2.compareHist(first[i].astype(np.float32), other[i].astype(np.float32), technique)
+                                for i in xrange(3)] for other in others])
+
+        return result.sum(axis=-1) / 3
 
 
 class CorrelationOpenCVComparator(OpenCVComparator):
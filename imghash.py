@@ -0,0 +1,86 @@
+import cv2
+
+
+def dhash(img, size=8):
+    """
+    Computes the difference hash of an image. The image is reduced to a
+    grayscale thumbnail of (size + 1) x size pixels and each bit of the
+    hash tells whether a pixel is brighter than its right neighbour.
+    :param img: the image to be hashed
+    :param size: the square root of the number of bits in the hash
+    :return: the hash as integer
+    """
+    if len(img.shape) == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    thumbnail = cv2.resize(img, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = (thumbnail[:, 1:] > thumbnail[:, :-1]).flatten()
+
+    result = 0
+    for bit in bits:
+        result = (result << 1) | int(bit)
+    return result
+
+
+def hamming(first, second):
+    """
+    Returns the number of differing bits of two hashes.
+    """
+    return bin(first ^ second).count('1')
+
+
+class BKTree(object):
+    """
+    A Burkhard-Keller tree indexing hashes by their hamming distance. A
+    lookup only visits the subtrees that can contain hashes within the
+    requested distance, instead of comparing against every hash.
+    """
+
+    def __init__(self, distance=hamming):
+        """
+        Default initializer
+        :param distance: the metric between two hashes
+        """
+        self.distance = distance
+        self.root = None
+
+    def add(self, key, value):
+        """
+        Adds a value to the index.
+        :param key: the hash of the value
+        :param value: the value that is returned on lookups
+        """
+        node = (key, value, {})
+        if self.root is None:
+            self.root = node
+            return
+
+        current = self.root
+        while True:
+            distance = self.distance(key, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, key, radius):
+        """
+        Looks up all values whose hash is within the given distance.
+        :param key: the hash to look for
+        :param radius: the maximum distance to the hash
+        :return: the list of values within the distance
+        """
+        results = []
+        if self.root is None:
+            return results
+
+        candidates = [self.root]
+        while candidates:
+            node_key, value, children = candidates.pop()
+            distance = self.distance(key, node_key)
+            if distance <= radius:
+                results.append(value)
+            for child_distance, child in children.iteritems():
+                if distance - radius <= child_distance <= distance + radius:
+                    candidates.append(child)
+        return results
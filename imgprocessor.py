@@ -1,33 +1,367 @@
 from abc import ABCMeta, abstractmethod
+import argparse
 import cv2
+import numpy as np
 
 
 class ImageProcessor(object):
+    """
+    A single step of the preprocessing. Every step takes an optional
+    destination buffer. If it has the shape of the result, the result
+    is written into it instead of allocating a new image.
+    """
     __metaclass__ = ABCMeta
 
     @abstractmethod
-    def process(self, img):
+    def process(self, img, dst=None):
         pass
 
+    def process_batch(self, imgs, dst=None):
+        """
+        Processes a batch of images stacked in one array along the
+        first axis. The default implementation processes the images
+        one by one into the rows of the destination array.
+        :param imgs: the images as array of shape (count, height, width[, channels])
+        :param dst: an optional preallocated destination array
+        :return: the processed images as one array
+        """
+        first = self.process(imgs[0], None if dst is None or len(dst) == 0 else dst[0])
+        shape = (len(imgs),) + first.shape
+        if dst is None or dst.shape != shape or dst.dtype != first.dtype:
+            dst = np.empty(shape, first.dtype)
+        dst[0] = first
+        for i in range(1, len(imgs)):
+            dst[i] = self.process(imgs[i], dst[i])
+        return dst
+
+
+def as_rows(imgs, dst):
+    """
+    Reshapes a batch of images into one tall image, so that pixel-wise
+    OpenCV functions process the whole batch in a single call.
+    :param imgs: the images as array of shape (count, height, width[, channels])
+    :param dst: the single channel destination array of the batch or None
+    :return: tuple of the tall source and the tall destination image
+    or None if dst does not fit
+    """
+    count, height, width = imgs.shape[:3]
+    rows = np.ascontiguousarray(imgs).reshape((count * height, width) + imgs.shape[3:])
+    if dst is None or dst.shape != (count, height, width) or not dst.flags.c_contiguous:
+        return rows, None
+    return rows, dst.reshape((count * height, width))
+
 
 class GrayscaleProcessor(ImageProcessor):
+    """
+    Converts BGR images to grayscale. Images that have a single channel
+    already are returned as they are.
+    """
+
+    def process(self, img, dst=None):
+        if len(img.shape) == 2:
+            return img
+        return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=dst)
+
+    def process_batch(self, imgs, dst=None):
+        if len(imgs.shape) == 3:
+            return imgs
+        rows, out = as_rows(imgs, dst)
+        return cv2.cvtColor(rows, cv2.COLOR_BGR2GRAY, dst=out).reshape(imgs.shape[:3])
+
+
+class ResizeProcessor(ImageProcessor):
+    """
+    Scales an image down to a fixed size. Area interpolation is used
+    by default as it gives the most stable result when shrinking.
+    """
+
+    def __init__(self, size, interpolation=cv2.INTER_AREA):
+        """
+        Default initializer
+        :param size: the target size as (width, height) tuple
+        :param interpolation: the OpenCV interpolation flag
+        """
+        self.size = size
+        self.interpolation = interpolation
+
+    def process(self, img, dst=None):
+        return cv2.resize(img, self.size, dst=dst, interpolation=self.interpolation)
+
+
+class CropProcessor(ImageProcessor):
+    """
+    Restricts an image to a region of interest. The result is a view
+    into the original image, no pixels are copied.
+    """
+
+    def __init__(self, region):
+        """
+        Default initializer
+        :param region: the region as (x, y, width, height) tuple
+        """
+        self.region = region
+
+    def process(self, img, dst=None):
+        x, y, width, height = self.region
+        return img[y:y + height, x:x + width]
+
+    def process_batch(self, imgs, dst=None):
+        x, y, width, height = self.region
+        return imgs[:, y:y + height, x:x + width]
+
+
+class BlurProcessor(ImageProcessor):
+    """
+    Smooths an image with a gaussian kernel, e.g. to suppress
+    compression noise before comparing frames.
+    """
+
+    def __init__(self, ksize=5):
+        """
+        Default initializer
+        :param ksize: the odd width and height of the kernel
+        """
+        self.ksize = (ksize, ksize)
+
+    def process(self, img, dst=None):
+        return cv2.GaussianBlur(img, self.ksize, 0, dst=dst)
+
+
+class BinarizeProcessor(ImageProcessor):
+    """
+    Turns a grayscale image into black text on white background, which
+    is what tesseract works best on. Without a fixed threshold Otsu's
+    method picks one per image.
+    """
 
-    def process(self, img):
-        return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    def __init__(self, threshold=None):
+        """
+        Default initializer
+        :param threshold: the fixed threshold or None to use Otsu's method
+        """
+        self.threshold = threshold
+
+    def process(self, img, dst=None):
+        if self.threshold is None:
+            return cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst=dst)[1]
+        return cv2.threshold(img, self.threshold, 255, cv2.THRESH_BINARY, dst=dst)[1]
+
+    def process_batch(self, imgs, dst=None):
+        if self.threshold is None:
+            return ImageProcessor.process_batch(self, imgs, dst)
+        # a fixed threshold is pixel-wise, the whole batch is done at once
+        rows, out = as_rows(imgs, dst)
+        return cv2.threshold(rows, self.threshold, 255, cv2.THRESH_BINARY, dst=out)[1].reshape(imgs.shape[:3])
+
+
+class DeskewProcessor(ImageProcessor):
+    """
+    Rotates a binarized page so that its text lines are horizontal. The
+    angle is the one at which the row profile of the dark pixels has
+    the highest variance, i.e. the rows alternate most clearly between
+    text and gaps. It is searched on a downscaled copy.
+    """
+
+    def __init__(self, max_angle=5.0, step=0.5, width=400):
+        """
+        Default initializer
+        :param max_angle: the largest skew in degrees that is corrected
+        :param step: the resolution of the angle search in degrees
+        :param width: the width of the copy the angle is searched on
+        """
+        self.angles = np.arange(-max_angle, max_angle + step / 2.0, step)
+        self.width = width
+
+    def angle(self, img):
+        """
+        Estimates the skew of a grayscale image.
+        :param img: the image with dark text on bright background
+        :return: the angle in degrees the image has to be rotated by
+        """
+        height, width = img.shape[:2]
+        scale = min(1.0, self.width / float(width))
+        small = cv2.resize(img, (max(1, int(width * scale)), max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+        ink = (small < 128).astype(np.float32)
+        center = (small.shape[1] / 2.0, small.shape[0] / 2.0)
+        best, best_score = 0.0, None
+        for angle in self.angles:
+            matrix = cv2.getRotationMatrix2D(center, angle, 1.0)
+            rotated = cv2.warpAffine(ink, matrix, (small.shape[1], small.shape[0]), flags=cv2.INTER_NEAREST)
+            score = np.var(rotated.sum(axis=1))
+            if best_score is None or score > best_score:
+                best, best_score = angle, score
+        return best
+
+    def process(self, img, dst=None):
+        angle = self.angle(img)
+        if angle == 0:
+            return img
+        height, width = img.shape[:2]
+        matrix = cv2.getRotationMatrix2D((width / 2.0, height / 2.0), angle, 1.0)
+        return cv2.warpAffine(img, matrix, (width, height), dst=dst, flags=cv2.INTER_LINEAR,
+                              borderMode=cv2.BORDER_REPLICATE)
+
+
+def detect_slide_region(frames, threshold=8, min_share=0.25, width=320):
+    """
+    Detects the region showing the slide in recordings with a moving
+    picture-in-picture inset, e.g. a speaker camera. Pixels that change
+    between most of the consecutive frames belong to the inset. The
+    slide is assumed to be the largest rectangle beside the inset.
+    The frames are compared as downscaled grayscale images one after
+    another, so that only two of them are kept at a time.
+    :param frames: iterable of frames sampled from the recording, e.g.
+    one per second from the first minutes
+    :param threshold: the difference from which on a pixel is
+    considered changed
+    :param min_share: the minimum share of the frame the slide region
+    has to cover, otherwise the whole frame is used
+    :param width: the width the frames are downscaled to
+    :return: the region as (x, y, width, height) tuple or None if there
+    are no frames
+    """
+    prev = None
+    # the number of consecutive pairs a pixel changed in
+    counts = None
+    pairs = 0
+    for frame in frames:
+        if len(frame.shape) == 3:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        else:
+            # the frames may be read into the same buffer
+            gray = frame.copy()
+        if prev is None:
+            full_height, full_width = gray.shape[:2]
+            scale = min(1.0, float(width) / full_width)
+            size = (max(1, int(round(full_width * scale))), max(1, int(round(full_height * scale))))
+            counts = np.zeros(size[::-1], np.uint16)
+        if gray.shape[1::-1] != size:
+            gray = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+        if prev is not None:
+            counts += cv2.absdiff(gray, prev) > threshold
+            pairs += 1
+        prev = gray
+    if prev is None:
+        return None
+    full = (0, 0, full_width, full_height)
+    if pairs < 2:
+        return full
+
+    # slide transitions change the slide area only in a few pairs, the
+    # pixels changing in most of them belong to the inset
+    moving = (counts * 2 > pairs).astype(np.uint8)
+    kernel = max(1, int(np.ceil(15 * scale)))
+    moving = cv2.dilate(moving, np.ones((kernel, kernel), np.uint8))
+    points = cv2.findNonZero(moving)
+    if points is None:
+        return full
+
+    # the bounding box of the inset in full resolution, rounded outwards
+    x, y, w, h = cv2.boundingRect(points)
+    left, top = int(np.floor(x / scale)), int(np.floor(y / scale))
+    right = min(full_width, int(np.ceil((x + w) / scale)))
+    bottom = min(full_height, int(np.ceil((y + h) / scale)))
+    candidates = [
+        (0, 0, left, full_height),
+        (right, 0, full_width - right, full_height),
+        (0, 0, full_width, top),
+        (0, bottom, full_width, full_height - bottom)
+    ]
+    region = max(candidates, key=lambda candidate: candidate[2] * candidate[3])
+    if region[2] * region[3] < min_share * full_width * full_height:
+        return full
+    return region
+
+
+def parse_region(region):
+    """
+    Parses a region given as "x,y,width,height". "auto" is returned as
+    it is.
+    :param region: the region string
+    :return: the region as (x, y, width, height) tuple or "auto"
+    """
+    if region == 'auto':
+        return region
+    x, y, width, height = [int(value) for value in region.split(',')]
+    return x, y, width, height
+
+
+def parse_fixed_region(region):
+    """
+    Parses a region given as "x,y,width,height" like parse_region for
+    the options of the tools that work on slides instead of the video,
+    where the region cannot be detected.
+    :param region: the region string
+    :return: the region as (x, y, width, height) tuple
+    """
+    if region == 'auto':
+        raise argparse.ArgumentTypeError("the region can only be detected in videos, give it as 'x,y,width,height'")
+    return parse_region(region)
+
+
+def parse_size(size):
+    """
+    Parses a size given as "WIDTHxHEIGHT" e.g. "160x90". "full" stands
+    for no size and is returned as None.
+    :param size: the size string
+    :return: the size as (width, height) tuple or None
+    """
+    if size == 'full':
+        return None
+    width, height = size.lower().split('x')
+    return int(width), int(height)
 
 
 class ImageProcessQueue(object):
+    """
+    A pipeline of processors that is applied to single images or to
+    batches. With reuse enabled every step keeps its output buffer and
+    writes the next result into it, so processing a stream of equally
+    sized frames does not allocate. The buffers rotate between the
+    given number of sets, a result stays valid until that many further
+    images have been processed.
+    """
 
-    def __init__(self, processors=None):
+    def __init__(self, processors=None, reuse=False, buffers=2):
+        """
+        Default initializer
+        :param processors: the initial list of processors
+        :param reuse: whether to write into preallocated output buffers
+        :param buffers: the number of buffer sets that are rotated
+        """
         elem = []
         if not processors is None:
             elem = processors
         self.queue = elem
+        self.reuse = reuse
+        self.buffers = [{} for _ in range(max(1, buffers))]
+        self.current = 0
 
     def add(self, processor):
         self.queue.append(processor)
 
+    def run(self, img, batch):
+        self.current = (self.current + 1) % len(self.buffers)
+        buffers = self.buffers[self.current]
+        for i, processor in enumerate(self.queue):
+            process = processor.process_batch if batch else processor.process
+            dst = buffers.get((batch, i)) if self.reuse else None
+            result = process(img, dst)
+            # views and passed through inputs are not owned by the
+            # pipeline and must not be written into later
+            if self.reuse and not np.may_share_memory(result, img):
+                buffers[(batch, i)] = result
+            img = result
+        return img
+
     def apply(self, img):
-        for processor in self.queue:
-            img = processor.process(img)
-        return img
\ No newline at end of file
+        return self.run(img, False)
+
+    def apply_batch(self, imgs):
+        """
+        Applies the pipeline to a batch of equally sized images.
+        :param imgs: the images as list or as array stacked along the
+        first axis
+        :return: the processed images as one array
+        """
+        return self.run(np.asarray(imgs), True)
@@ -1,4 +1,5 @@
 import operator
+import numpy as np
 import pandas
 
 from ui import ProgressController as pc
@@ -56,3 +57,98 @@ def ls(s, t, comp=operator.eq):
     # pandas.DataFrame(dist).to_csv("results")
     progress.finish()
     return dist[rows - 1][cols - 1]
+
+
+def distance(s, t, comparator=None, band=None, path=False):
+    """
+    Levenshtein distance between the sequences s and t. The equality of
+    all pairs of elements is determined up front, either in a few
+    batched comparisons through the comparator or with ==.
+    :param s: the source sequence
+    :param t: the target sequence
+    :param comparator: an ImageComparator whose same_matrix decides
+    whether two elements are equal. None compares with ==.
+    :param band: see matrix_distance
+    :param path: see matrix_distance
+    :return: see matrix_distance
+    """
+    if comparator is None:
+        equal = np.array([[a == b for b in t] for a in s], dtype=bool).reshape(len(s), len(t))
+    else:
+        equal = comparator.same_matrix(s, t)
+    return matrix_distance(equal, band, path)
+
+
+def matrix_distance(equal, band=None, path=False):
+    """
+    Levenshtein distance from a precomputed equality matrix. Only two
+    rows of the distance table are kept, unless the alignment path is
+    requested. Each row is computed with a few NumPy operations: the
+    deletions and substitutions element-wise and the insertions as a
+    running minimum along the row.
+    :param equal: n x m boolean array telling whether the i-th element
+    of the source equals the j-th element of the target
+    :param band: if given, only alignments that never move more than
+    this many elements away from the diagonal are considered
+    :param path: if True, the alignment is returned as well
+    :return: the distance, or a tuple of the distance and the
+    alignment as list of (i, j) pairs, where i or j is None for
+    insertions and deletions respectively
+    """
+    rows, cols = equal.shape
+    cost = np.logical_not(equal).astype(np.int64)
+    columns = np.arange(cols + 1)
+    infinity = rows + cols + 1
+    if band is not None:
+        band = max(band, abs(rows - cols))
+
+    previous = columns.copy()
+    if band is not None:
+        previous[band + 1:] = infinity
+    table = None
+    if path:
+        table = np.empty((rows + 1, cols + 1), dtype=np.int64)
+        table[0] = previous
+
+    for row in xrange(1, rows + 1):
+        current = np.empty(cols + 1, dtype=np.int64)
+        current[0] = row
+        current[1:] = np.minimum(previous[1:] + 1, previous[:-1] + cost[row - 1])
+        if band is not None:
+            current[:max(0, row - band)] = infinity
+            current[row + band + 1:] = infinity
+        current = np.minimum.accumulate(current - columns) + columns
+        if band is not None:
+            current[row + band + 1:] = infinity
+        if path:
+            table[row] = current
+        previous = current
+
+    result = int(previous[cols])
+    if not path:
+        return result
+    return result, backtrack(table, cost)
+
+
+def backtrack(table, cost):
+    """
+    Follows the distance table back from the last cell to the first.
+    :param table: the full distance table
+    :param cost: the substitution cost matrix
+    :return: the alignment as list of (i, j) pairs
+    """
+    i, j = cost.shape
+    alignment = []
+    while i > 0 or j > 0:
+        if i > 0 and j > 0 and table[i, j] == table[i - 1, j - 1] + cost[i - 1, j - 1]:
+            i -= 1
+            j -= 1
+            alignment.append((i, j))
+        elif i > 0 and table[i, j] == table[i - 1, j] + 1:
+            i -= 1
+            alignment.append((i, None))
+        else:
+            j -= 1
+            alignment.append((None, j))
+    alignment.reverse()
+    return alignment
@@ -1,31 +1,112 @@
 import argparse
+import multiprocessing
 import os.path as p
+import time
 import sources
 from detector import Detector
 from sorter import SlideSorter
 from extractor import ContentExtractor
+from ocrcache import OCRCache
 
 
-def execute(inputfile, extractor_out, detector_out=None, sorter_out=None):
+def execute(inputfile, extractor_out, detector_out=None, sorter_out=None, stream=False, buffer_size=4,
+            ocr_cache=None):
+    """
+    Runs the detection, sorting and extraction for a single file.
+    :param stream: if True, the slides flow through the stages as soon
+    as they are detected, with at most buffer_size slides in flight
+    between two stages. Otherwise each stage completes before the next
+    one starts.
+    :param buffer_size: the number of slides buffered between stages
+    :param ocr_cache: optional directory of the OCR cache
+    """
+    cache = None
+    if ocr_cache is not None:
+        cache = OCRCache(ocr_cache)
     detector = Detector(inputfile, outpath=detector_out)
-    sorter = SlideSorter(sources.ListSource(detector.detect_slides()), outpath=sorter_out)
-    extractor = ContentExtractor(sources.ListSource(sorter.sort()), output_dir=extractor_out)
+    if stream:
+        sorter = SlideSorter(sources.BufferedSource(sources.AnalyzerSource(detector), buffer_size), outpath=sorter_out,
+                             fingerprint=(320, 180))
+        extractor = ContentExtractor(sources.BufferedSource(sources.AnalyzerSource(sorter), buffer_size),
+                                     output_dir=extractor_out, cache=cache)
+    else:
+        sorter = SlideSorter(sources.ListSource(detector.detect_slides()), outpath=sorter_out)
+        extractor = ContentExtractor(sources.ListSource(sorter.sort()), output_dir=extractor_out, cache=cache)
     extractor.analyze()
 
 
-def batchExecute(inputfiles, extractor_out="contents/", detector_out="detected_slides/", sorter_out="sorted_slides"):
+def execute_job(job):
+    """
+    Executes the pipeline for a single file and reports the outcome
+    instead of raising errors, so that one broken file does not stop
+    the whole batch.
+    :param job: the arguments of execute as tuple
+    :return: tuple of the input file, whether it succeeded, the
+    elapsed time in seconds and the error message
+    """
+    inputfile = job[0]
+    print "Analyzing " + p.basename(inputfile) + ":"
+    start = time.time()
+    try:
+        execute(*job)
+    except Exception as e:
+        return inputfile, False, time.time() - start, str(e)
+    return inputfile, True, time.time() - start, None
+
+
+def batchExecute(inputfiles, extractor_out="contents/", detector_out="detected_slides/", sorter_out="sorted_slides",
+                 jobs=1, stream=False, ocr_cache=None):
+    """
+    Executes the pipeline for each of the input files.
+    :param jobs: the number of files processed concurrently. Each file
+    is processed in its own process, which bounds memory and CPU usage
+    to this many pipelines at a time.
+    :param stream: whether the stages of each pipeline stream their
+    slides, see execute
+    :param ocr_cache: optional directory of the OCR cache shared by all
+    files
+    :return: the list of (file, success, elapsed time, error) tuples
+    """
+    tasks = []
     for file in inputfiles:
         name = p.basename(file)
         extractor = p.join(extractor_out, name) + p.sep
         sorter = p.join(sorter_out, name) + p.sep
         detector = p.join(detector_out, name) + p.sep
-        print "Analyzing " + name + ":"
-        execute(file, extractor, detector, sorter)
-        print
+        tasks.append((file, extractor, detector, sorter, stream, 4, ocr_cache))
+
+    pool = None
+    if jobs > 1:
+        pool = multiprocessing.Pool(jobs, maxtasksperchild=1)
+        outcomes = pool.imap_unordered(execute_job, tasks)
+    else:
+        outcomes = (execute_job(task) for task in tasks)
+
+    results = []
+    try:
+        for file, success, elapsed, error in outcomes:
+            if success:
+                print "%s: done in %.1fs" % (p.basename(file), elapsed)
+            else:
+                print "%s: failed after %.1fs (%s)" % (p.basename(file), elapsed, error)
+            print
+            results.append((file, success, elapsed, error))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    failed = len([result for result in results if not result[1]])
+    print "%d of %d files analyzed successfully" % (len(results) - failed, len(results))
+    return results
 
 if __name__ == "__main__":
 
     Parser = argparse.ArgumentParser(description="Slide Detector")
     Parser.add_argument("files", help="video device number or path to video file", nargs='+')
+    Parser.add_argument("-j", "--jobs", help="number of files processed concurrently", type=int, default=1)
+    Parser.add_argument("-s", "--stream", help="pass the slides through all stages as soon as they are detected",
+                        action="store_true")
+    Parser.add_argument("-c", "--ocr-cache", help="directory of the OCR cache", default=None)
     Args = Parser.parse_args()
-    batchExecute(Args.files)
+    batchExecute(Args.files, jobs=Args.jobs, stream=Args.stream, ocr_cache=Args.ocr_cache)
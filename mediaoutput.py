@@ -2,8 +2,12 @@ from abc import ABCMeta, abstractmethod
 import datetime
 import cv2
 import math
+import numpy as np
 import os
 import errno
+import Queue
+import sys
+import threading
 
 
 class MediaWriter(object):
@@ -22,27 +26,57 @@ class MediaWriter(object):
         """
         pass
 
+    def close(self):
+        """
+        Finishes all pending writes and releases the resources of the
+        writer.
+        """
+        pass
+
 
 class NullWriter(MediaWriter):
     def write(self, content, *args):
         pass
 
 
+class EncodedImage(object):
+    """
+    An image that has already been encoded into a file format, so that
+    it can be written to disk without encoding it again.
+    """
+
+    def __init__(self, data, file_format):
+        """
+        Default initializer
+        :param data: the encoded bytes of the image
+        :param file_format: the file format of the encoding e.g. '.png'
+        """
+        self.data = data
+        self.file_format = normalize_format(file_format)
+
+    def decode(self):
+        return cv2.imdecode(np.frombuffer(self.data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
 class ImageWriter(MediaWriter):
     """
     The ImageWriter will write an image to disk.
     """
     __metaclass__ = ABCMeta
 
-    def __init__(self, prefix, file_format):
+    def __init__(self, prefix, file_format, params=None):
         """
         Default initializer
         :param prefix: the filename prefix a counter will be added
         after this string and incremented after each write to disk
         :param file_format: the file format for the images.
+        :param params: the encoding parameters passed to OpenCV, see
+        encoding_params
         """
         if not file_format.startswith('.'):
             file_format = '.' + file_format
+        self.file_format = normalize_format(file_format)
+        self.params = params or []
         if prefix is not None:
             setup_dirs(prefix)
             self.name = prefix + file_format
@@ -53,7 +87,40 @@ class ImageWriter(MediaWriter):
         initializer
         :param img: the image that will be written to disk
         """
-        cv2.imwrite(self.name % self.next_name(args), img)
+        self.save(self.filename(args), img)
+
+    def filename(self, args):
+        """
+        Returns the path of the next image.
+        :param args: the args, that are passed to write
+        :return: the path where the next image is written to
+        """
+        return self.name % self.next_name(args)
+
+    def save(self, filename, img):
+        """
+        Encodes the image and writes it to the given path. Images that
+        are already encoded in the file format of the writer are written
+        as they are.
+        :param filename: the path of the image
+        :param img: the image or EncodedImage that will be written to disk
+        """
+        if isinstance(img, EncodedImage):
+            if img.file_format == self.file_format:
+                with open(filename, 'wb') as image_file:
+                    image_file.write(img.data)
+                return
+            img = img.decode()
+        if not cv2.imwrite(filename, img, self.params):
+            raise IOError("could not write image to %s" % filename)
+
+    def encode(self, img):
+        """
+        Encodes the image the same way it would be written to disk.
+        :param img: the image or EncodedImage
+        :return: the EncodedImage
+        """
+        return encode(img, self.file_format, self.params)
 
     @abstractmethod
     def next_name(self, *args):
@@ -70,13 +137,14 @@ class CustomImageWriter(ImageWriter):
     Image Writer that uses a custom name. It takes it as the first
     argument in *args in the write method.
     """
-    def __init__(self, prefix=None, file_format='.jpg'):
+    def __init__(self, prefix=None, file_format='.jpg', params=None):
         """
         Default initializer
         :param prefix: the file location and file name prefix
         :param file_format: the file format e.g. .jpg, .png
+        :param params: the encoding parameters, see encoding_params
         """
-        super(CustomImageWriter, self).__init__(prefix + '%s', file_format)
+        super(CustomImageWriter, self).__init__(prefix + '%s', file_format, params)
 
     def next_name(self, *args):
         return args[0]
@@ -89,19 +157,20 @@ class IncrementalImageWriter(ImageWriter):
     specified step size after each write.
     """
 
-    def __init__(self, prefix=None, file_format='.jpg', start=0, step=1):
+    def __init__(self, prefix=None, file_format='.jpg', start=0, step=1, params=None):
         """
         Default initializer
         :param prefix: the file location and file name
         :param file_format: the file format e.g. .jpg, .png
         :param start: the starting number for the incremental count
         :param step: the step by which the count should increment
+        :param params: the encoding parameters, see encoding_params
         """
         self.count = start - step
         self.step = step
         if prefix is not None:
             prefix += '%d'
-        super(IncrementalImageWriter, self).__init__(prefix, file_format)
+        super(IncrementalImageWriter, self).__init__(prefix, file_format, params)
 
     def next_name(self, *args):
         self.count += self.step
@@ -114,18 +183,19 @@ class TimestampImageWriter(ImageWriter):
     the image was first shown in the original stream
     """
 
-    def __init__(self, fps, prefix=None, file_format='.jpg'):
+    def __init__(self, fps, prefix=None, file_format='.jpg', params=None):
         """
         Default initializer
         :param fps: The number of frames per second in the original stream
         :param prefix: the prefix of the path to the output location
         :param file_format: the file format of the output image
+        :param params: the encoding parameters, see encoding_params
         """
         self.fps = fps
 
         if prefix is not None:
             prefix += '%s'
-        super(TimestampImageWriter, self).__init__(prefix, file_format)
+        super(TimestampImageWriter, self).__init__(prefix, file_format, params)
 
     def next_name(self, args):
         current_frame = args[0]
@@ -138,38 +208,141 @@ class TimestampImageWriter(ImageWriter):
         return str(datetime.timedelta(seconds=int(seconds))) + '.' + milliseconds.zfill(3)
 
 
+class AsyncWriter(MediaWriter):
+    """
+    The AsyncWriter wraps another MediaWriter and performs its writes in
+    background threads, so that encoding does not stall the caller. The
+    queue of pending writes is bounded: when it is full, write blocks
+    until a worker is available.
+    """
+
+    def __init__(self, writer, workers=2, queue_size=8):
+        """
+        Default initializer
+        :param writer: the writer performing the actual writes
+        :param workers: the number of threads writing concurrently.
+        Writers other than ImageWriters are always used by a single
+        thread to keep the order of their writes.
+        :param queue_size: the maximum number of pending writes
+        """
+        self.writer = writer
+        if not isinstance(writer, ImageWriter):
+            workers = 1
+        self.queue = Queue.Queue(maxsize=queue_size)
+        self.error = None
+        self.threads = []
+        for _ in xrange(max(1, workers)):
+            thread = threading.Thread(target=self.work)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def write(self, content, *args):
+        self.raise_error()
+        if isinstance(self.writer, ImageWriter):
+            # the name has to be determined in order of the writes
+            task = (self.writer.save, (self.writer.filename(args), content))
+        else:
+            task = (self.writer.write, (content,) + args)
+        self.queue.put(task)
+
+    def work(self):
+        while True:
+            task = self.queue.get()
+            try:
+                if task is None:
+                    return
+                if self.error is None:
+                    function, args = task
+                    function(*args)
+            except Exception:
+                if self.error is None:
+                    self.error = sys.exc_info()
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        """
+        Blocks until all pending writes are finished.
+        Raises the first error of the writes, if one occurred.
+        """
+        self.queue.join()
+        self.raise_error()
+
+    def close(self):
+        """
+        Finishes all pending writes, stops the threads and closes the
+        wrapped writer. Raises the first error of the writes, if one
+        occurred.
+        """
+        if self.threads:
+            self.queue.join()
+            for _ in self.threads:
+                self.queue.put(None)
+            for thread in self.threads:
+                thread.join()
+            self.threads = []
+        self.writer.close()
+        self.raise_error()
+
+    def raise_error(self):
+        """
+        Raises the first error of the writes with its original
+        traceback. The writer stays failed, every later call raises
+        the error again.
+        """
+        if self.error is not None:
+            raise self.error[0], self.error[1], self.error[2]
+
+
 class TimetableWriter(MediaWriter):
     """
     The Timetable Writer outputs each slide iteratively using
     the IncrementalImageWriter. Additionally it outputs a ".txt"
     document containing the slide name and their appearances.
     """
-    def __init__(self, output_dir, timetable_loc, file_format):
+    def __init__(self, output_dir, timetable_loc, file_format, workers=0, params=None):
         """
         Default initializer
         :param output_dir: the output directory for the sorted slides
         :param timetable_file: where the timetable file should be stored
+        :param workers: the number of threads writing the slides in the
+        background. 0 writes them synchronously.
+        :param params: the encoding parameters, see encoding_params
         """
         setup_dirs(timetable_loc)
         self.timetable = open(timetable_loc, 'w')
-        self.img_writer = IncrementalImageWriter(prefix=output_dir, start=1, file_format=file_format)
+        self.img_writer = IncrementalImageWriter(prefix=output_dir, start=1, file_format=file_format, params=params)
+        if workers > 0:
+            self.img_writer = AsyncWriter(self.img_writer, workers)
         self.txt_writer = TextWriter(self.timetable)
+        self.appearances = []
 
     def write(self, slides, *args):
-        i = 1
+        """
+        Writes the images of the given slides right away, so that write
+        can be called with each slide as soon as it is sorted. Only the
+        appearances are kept, as later duplicates still add to them,
+        they are written to the timetable on close.
+        :param slides: the sorted slides, marked duplicates are skipped
+        """
         for slide in slides:
             if slide.marked:
                 continue
-            self.img_writer.write(slide.img)
-            appearances = slide.time
-            for com in slide.times:
-                appearances += " " + com
-            self.txt_writer.write("Slide %d: %s\n" % (i, appearances))
-            i += 1
-
+            # reuse the encoding of the detector if there is one
+            if slide.encoded is not None:
+                self.img_writer.write(slide.encoded)
+            else:
+                self.img_writer.write(slide.img)
+            self.appearances.append((slide.time, slide.times))
 
     def close(self):
+        if self.timetable.closed:
+            return
+        for i, (time, times) in enumerate(self.appearances, 1):
+            self.txt_writer.write("Slide %d: %s\n" % (i, " ".join([time] + times)))
         self.timetable.close()
+        self.img_writer.close()
 
 
 class TextWriter(MediaWriter):
@@ -179,6 +352,60 @@ class TextWriter(MediaWriter):
     def write(self, content, *args):
         self.output_file.write(content)
 
+def encode(img, file_format, params=None):
+    """
+    Encodes an image into the given file format. Images that are
+    already encoded in this format are returned as they are.
+    :param img: the image or EncodedImage
+    :param file_format: the file format e.g. '.png'
+    :param params: the encoding parameters, see encoding_params
+    :return: the EncodedImage
+    """
+    file_format = normalize_format(file_format)
+    if isinstance(img, EncodedImage):
+        if img.file_format == file_format:
+            return img
+        img = img.decode()
+    ret, data = cv2.imencode(file_format, img, params or [])
+    if not ret:
+        raise IOError("could not encode image as %s" % file_format)
+    return EncodedImage(data.tobytes(), file_format)
+
+
+def normalize_format(file_format):
+    """
+    Returns the canonical spelling of a file format e.g. '.jpg' for
+    '.JPEG'.
+    """
+    file_format = file_format.lower()
+    if file_format == '.jpeg':
+        return '.jpg'
+    return file_format
+
+
+def encoding_params(file_format, compression=None, quality=None):
+    """
+    Returns the OpenCV encoding parameters for a file format.
+    :param file_format: the file format e.g. '.png', '.jpg', '.webp'
+    :param compression: the PNG compression level from 0 (fastest) to 9
+    (smallest). None keeps the OpenCV default.
+    :param quality: the JPEG quality from 0 to 100 or the WebP quality
+    from 1 to 100. None keeps the OpenCV default.
+    :return: the list of parameters for cv2.imwrite and cv2.imencode
+    """
+    if not file_format.startswith('.'):
+        file_format = '.' + file_format
+    file_format = normalize_format(file_format)
+    params = []
+    if file_format == '.png' and compression is not None:
+        params += [cv2.IMWRITE_PNG_COMPRESSION, compression]
+    elif file_format == '.jpg' and quality is not None:
+        params += [cv2.IMWRITE_JPEG_QUALITY, quality]
+    elif file_format == '.webp' and quality is not None:
+        params += [cv2.IMWRITE_WEBP_QUALITY, quality]
+    return params
+
+
 def setup_dirs(path):
     """
     Takes a path and makes sure that directories to the path
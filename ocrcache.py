@@ -0,0 +1,119 @@
+import codecs
+import hashlib
+import os
+
+import mediaoutput
+
+
+class OCRCache(object):
+    """
+    Persistent cache of OCR results on disk. The results are keyed by a
+    hash of the preprocessed image together with the language and the
+    OCR settings, so the same slide is only recognized once. When the
+    cache grows beyond its maximum size, the least recently used
+    results are removed.
+    """
+
+    def __init__(self, directory, max_size=512 * 1024 * 1024):
+        """
+        Default initializer
+        :param directory: where the results are stored
+        :param max_size: the maximum size of the cache in bytes
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        mediaoutput.setup_dirs(os.path.join(directory, ''))
+        self.size = sum(os.path.getsize(path) for path in self.files())
+
+    def key(self, img, lang, settings=''):
+        """
+        Returns the key of an OCR result.
+        :param img: the preprocessed image as NumPy array
+        :param lang: the language of the OCR
+        :param settings: a description of the OCR settings
+        :return: the key as hex string
+        """
+        digest = hashlib.sha1()
+        digest.update(str(img.shape))
+        digest.update(str(img.dtype))
+        digest.update(img.tobytes())
+        digest.update(lang)
+        digest.update(settings)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Looks up an OCR result.
+        :param key: the key of the result
+        :return: tuple of the text and the hOCR document or None
+        """
+        text_path, hocr_path = self.paths(key)
+        try:
+            with codecs.open(text_path, encoding='utf-8') as text_file:
+                text = text_file.read()
+            with codecs.open(hocr_path, encoding='utf-8') as hocr_file:
+                hocr = hocr_file.read()
+            os.utime(text_path, None)
+            os.utime(hocr_path, None)
+        except (IOError, OSError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return text, hocr
+
+    def put(self, key, text, hocr):
+        """
+        Stores an OCR result.
+        :param key: the key of the result
+        :param text: the recognized text
+        :param hocr: the hOCR document
+        """
+        for path, content in zip(self.paths(key), (text, hocr)):
+            # write to a temporary file first, so that concurrent readers
+            # never see partial results
+            temp_path = path + '.tmp%d' % os.getpid()
+            with codecs.open(temp_path, 'w', encoding='utf-8') as cache_file:
+                cache_file.write(content)
+            self.size += os.path.getsize(temp_path)
+            os.rename(temp_path, path)
+        if self.size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used results until the cache is at
+        most 90% full. The text and the hOCR document of a result are
+        always removed together.
+        """
+        results = {}
+        for path in self.files():
+            key = os.path.splitext(os.path.basename(path))[0]
+            mtime, size = results.get(key, (0, 0))
+            results[key] = (max(mtime, os.path.getmtime(path)), size + os.path.getsize(path))
+        self.size = sum(size for _, size in results.itervalues())
+        for _, size, key in sorted((mtime, size, key) for key, (mtime, size) in results.iteritems()):
+            if self.size <= self.max_size * 0.9:
+                break
+            for path in self.paths(key):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self.size -= size
+
+    def paths(self, key):
+        return os.path.join(self.directory, key + '.txt'), os.path.join(self.directory, key + '.hocr')
+
+    def files(self):
+        for filename in os.listdir(self.directory):
+            if filename.endswith('.txt') or filename.endswith('.hocr'):
+                yield os.path.join(self.directory, filename)
+
+    def stats(self):
+        """
+        Returns the statistics of the cache.
+        :return: tuple of the number of hits and misses
+        """
+        return self.hits, self.misses
@@ -1,4 +1,5 @@
 import mediaoutput
+import archive
 import argparse
 import cv2
 import os
@@ -13,28 +14,59 @@ class SlideParser(object):
     their name representing their timestamp. (Possibly containing
     duplicates.)
     """
-    def __init__(self, slides_dir, timetable_path, output_dir, file_format):
+    def __init__(self, slides_dir, timetable_path, output_dir, file_format, lazy=False, mmap=False):
         """
         Default initializer
         :param slides_dir: where the unique slides are located
-        :param timetable_path: where the timetable file is located
+        :param timetable_path: where the timetable file is located.
+        If None, the appearances stored in the slide archive at
+        slides_dir are used.
+        :param output_dir: where the slides are written to. Paths ending
+        with '.slar' are written as a single slide archive.
+        :param lazy: whether the slides are decoded on access
+        :param mmap: whether the decoded slides are kept in a memory
+        mapped file, see SlideDataHelper
         """
         self.timetable_path = timetable_path
-        self.slides = SlideDataHelper(slides_dir).get_slides()
+        self.helper = SlideDataHelper(slides_dir, lazy=lazy, mmap=mmap)
+        self.slides = self.helper.get_slides()
         self.output_dir = output_dir
         self.file_format = file_format
 
     def parse(self):
         """
         Parses the timetable and writes the images to disk accordingly.
+        The slides are closed afterwards.
         """
-        writer = mediaoutput.CustomImageWriter(self.output_dir, self.file_format)
-        with open(self.timetable_path) as timetable:
-            for line in timetable:
-                slide = self.slides.pop(0)
-                slide_times = line[line.index(':') + 2:].split(' ')
-                for time in slide_times:
-                    writer.write(slide.img, time.rstrip())
+        try:
+            self.write_slides()
+        finally:
+            self.helper.close()
+
+    def write_slides(self):
+        """
+        Writes the image of each slide once per appearance.
+        """
+        if archive.is_archive(self.output_dir):
+            writer = archive.SlideArchiveWriter(self.output_dir, file_format=self.file_format)
+            write = writer.add
+        else:
+            writer = mediaoutput.CustomImageWriter(self.output_dir, self.file_format)
+            write = writer.write
+
+        if self.timetable_path is None:
+            for slide in self.slides:
+                for time in [slide.time] + slide.times:
+                    write(slide.img, time)
+        else:
+            slides = iter(self.slides)
+            with open(self.timetable_path) as timetable:
+                for line in timetable:
+                    slide = next(slides)
+                    slide_times = line[line.index(':') + 2:].split(' ')
+                    for time in slide_times:
+                        write(slide.img, time.rstrip())
+        writer.close()
 
 
 if __name__ == '__main__':
@@ -45,10 +77,13 @@ if __name__ == '__main__':
                         default="reversed/")
     Parser.add_argument("-f", "--fileformat", help="file format of the output images e.g. '.jpg'",
                         default=".jpg", nargs='?')
+    Parser.add_argument("--lazy", help="decode the slides only when they are accessed", action="store_true")
+    Parser.add_argument("--mmap", help="keep the decoded slides in memory mapped files, in DIR for later runs "
+                                       "or temporary ones", nargs='?', const=True, default=False, metavar="DIR")
     Args = Parser.parse_args()
-    if Args.timetable is None:
+    if Args.timetable is None and not archive.is_archive(Args.inputslides):
         Args.timetable = os.path.join(Args.inputslides, "timetable.txt")
 
-    SlideParser(Args.inputslides, Args.timetable, Args.output_dir, Args.fileformat).parse()
+    SlideParser(Args.inputslides, Args.timetable, Args.output_dir, Args.fileformat, Args.lazy, Args.mmap).parse()
 
     cv2.destroyAllWindows()
@@ -0,0 +1,56 @@
+import os
+import re
+import subprocess
+
+PTS_TIME = re.compile(r'pts_time:\s*(-?[0-9]+(?:\.[0-9]+)?)')
+START_TIME = re.compile(r'Duration: .*, start: (-?[0-9]+(?:\.[0-9]+)?)')
+
+
+def scene_changes(path, threshold=0.03, width=320, ffmpeg='ffmpeg'):
+    """
+    Finds the timestamps of scene changes in a video with the scene
+    detection of ffmpeg, which runs as a separate process. The frames
+    are downscaled before scoring, which is a lot faster than decoding
+    them into full resolution images.
+    :param path: the path of the video file
+    :param threshold: the scene score from 0 to 1 above which a frame
+    is a candidate. Slide changes often only change a small part of
+    the frame, so the threshold has to be low.
+    :param width: the width the frames are scaled to before scoring
+    :param ffmpeg: the ffmpeg executable
+    :return: the sorted list of timestamps in seconds from the first
+    frame on. Containers like MPEG-TS do not start at 0, their start
+    time is subtracted.
+    """
+    video_filter = "scale=%d:-2,select='gt(scene,%f)',showinfo" % (width, threshold)
+    args = [ffmpeg, '-nostdin', '-hide_banner', '-i', path, '-an', '-sn', '-vf', video_filter, '-f', 'null', '-']
+    with open(os.devnull, 'w') as devnull:
+        process = subprocess.Popen(args, stdout=devnull, stderr=subprocess.PIPE)
+        times = []
+        lines = []
+        start = 0.0
+        # ffmpeg describes the input first, then showinfo reports every
+        # selected frame on stderr
+        for line in iter(process.stderr.readline, ''):
+            match = PTS_TIME.search(line)
+            if match is not None:
+                times.append(float(match.group(1)))
+                continue
+            match = START_TIME.search(line)
+            if match is not None and not times:
+                start = float(match.group(1))
+            lines = (lines + [line])[-5:]
+        process.stderr.close()
+        if process.wait() != 0:
+            raise IOError("ffmpeg failed on %s: %s" % (path, ''.join(lines).strip()))
+    return sorted(time - start for time in times)
+
+
+def candidate_frames(times, fps):
+    """
+    Converts timestamps into frame positions.
+    :param times: the timestamps in seconds
+    :param fps: the frame rate of the video
+    :return: the sorted list of distinct frame positions
+    """
+    return sorted(set(int(round(time * fps)) for time in times))
@@ -1,10 +1,20 @@
 import os
+import archive
 import cv2
+import hashlib
+import json
+import mediaoutput
 import numpy
 import re
+import shutil
+import tempfile
 
 from PIL import Image
 from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+MMAP_NAME = 'slides%s.npy'
 
 
 def numericalSort(value):
@@ -30,6 +40,7 @@ class Slide(object):
         self.times = []
         self.reference = None
         self.page_number = 0
+        self.encoded = None
 
     def add_time(self, time):
         """
@@ -40,21 +51,199 @@ class Slide(object):
         self.times.append(time)
 
 
+class LazySlide(Slide):
+    """
+    A slide whose image is only decoded when it is accessed.
+    """
+    def __init__(self, time, slides, index):
+        """
+        Default initializer
+        :param time: the time when the slide appears
+        :param slides: the LazySlides the slide belongs to
+        :param index: the index of the slide in slides
+        """
+        self.slides = slides
+        self.index = index
+        self.replacement = None
+        super(LazySlide, self).__init__(time, None)
+
+    @property
+    def img(self):
+        if self.replacement is not None:
+            return self.replacement
+        return self.slides.get_img(self.index)
+
+    @img.setter
+    def img(self, img):
+        self.replacement = img
+
+
+class LazySlides(object):
+    """
+    A list of slides that only knows the files of the slides. The
+    images are decoded on access and a bounded number of them is kept
+    in memory. Optionally all images are stored in a single memory
+    mapped NumPy file, so subsequent runs do not decode them at all.
+    """
+    def __init__(self, files, imgreader, cache_size=32, mmap_path=None, temporary=False):
+        """
+        Default initializer
+        :param files: the list of (time, file path) tuples
+        :param imgreader: the ImageReader decoding the files
+        :param cache_size: the number of decoded images kept in memory
+        :param mmap_path: where the memory mapped file is stored. None
+        disables it.
+        :param temporary: whether the memory mapped file is only used
+        by this instance. It is removed on close together with its
+        directory.
+        """
+        self.files = files
+        self.imgreader = imgreader
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.mmap_path = mmap_path
+        self.temporary = temporary
+        self.mmap = None
+        self.slides = [LazySlide(time, self, i) for i, (time, _) in enumerate(files)]
+
+    def __len__(self):
+        return len(self.slides)
+
+    def __getitem__(self, index):
+        return self.slides[index]
+
+    def __iter__(self):
+        return iter(self.slides)
+
+    def get_img(self, index):
+        """
+        Returns the decoded image of the slide at the index.
+        :param index: the index of the slide
+        :return: the image of the slide
+        """
+        if self.mmap_path is not None and self.mmap is None:
+            self.mmap = self.open_mmap()
+            if self.mmap is None:
+                # the partially written file is of no use
+                self.remove_mmap()
+        if self.mmap is not None:
+            return self.mmap[index]
+
+        if index in self.cache:
+            img = self.cache.pop(index)
+        else:
+            img = self.imgreader.get_img(self.files[index][1])
+        if self.cache_size > 0:
+            self.cache[index] = img
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return img
+
+    def open_mmap(self):
+        """
+        Opens the memory mapped file of the images. If it does not
+        exist or the images on disk changed, it gets rebuilt.
+        :return: the memory mapped array or None, if the images could
+        not be stored in a single file
+        """
+        index_path = self.mmap_path + '.json'
+        index = [[os.path.basename(path), os.path.getmtime(path), os.path.getsize(path)] for _, path in self.files]
+        try:
+            with open(index_path) as index_file:
+                if json.load(index_file) == index:
+                    return numpy.load(self.mmap_path, mmap_mode='r')
+        except (IOError, OSError, ValueError):
+            pass
+
+        if len(self.files) == 0:
+            return None
+        try:
+            mmap = None
+            for i, (_, path) in enumerate(self.files):
+                img = self.imgreader.get_img(path)
+                if not isinstance(img, numpy.ndarray) or (mmap is not None and img.shape != mmap.shape[1:]):
+                    return None
+                if mmap is None:
+                    mmap = numpy.lib.format.open_memmap(self.mmap_path, mode='w+', dtype=img.dtype,
+                                                        shape=(len(self.files),) + img.shape)
+                mmap[i] = img
+            mmap.flush()
+            with open(index_path, 'w') as index_file:
+                json.dump(index, index_file)
+        except (IOError, OSError):
+            return None
+        return numpy.load(self.mmap_path, mmap_mode='r')
+
+    def remove_mmap(self):
+        """
+        Removes the memory mapped file and its index, a temporary file
+        together with its directory. The images are decoded on access
+        afterwards.
+        """
+        self.mmap = None
+        if self.mmap_path is None:
+            return
+        if self.temporary:
+            shutil.rmtree(os.path.dirname(self.mmap_path), ignore_errors=True)
+        else:
+            for path in (self.mmap_path, self.mmap_path + '.json'):
+                if os.path.exists(path):
+                    os.remove(path)
+        self.mmap_path = None
+
+    def close(self):
+        """
+        Releases the decoded images. A temporary memory mapped file is
+        removed.
+        """
+        self.cache.clear()
+        self.mmap = None
+        if self.temporary:
+            self.remove_mmap()
+
+
 class SlideDataHelper(object):
     """
     The helps to get slides from data.
     """
-    def __init__(self, path, image_type="opencv"):
+    def __init__(self, path, image_type="opencv", lazy=False, cache_size=32, mmap=False, workers=1, reduce=None):
         """
         Default initializer
         :param path: the path, where the slide is stored on disk
         :image_type: the type representing the image. Either "opencv" or "pil" might be required for certain usage.
+        :param lazy: if True, get_slides returns LazySlides that decode
+        the images on access.
+        :param cache_size: the number of decoded images lazy slides
+        keep in memory
+        :param mmap: if True, lazy slides store the decoded images in a
+        temporary memory mapped file, which is removed on close. If it
+        is a directory, the file is kept in it, so later runs skip
+        decoding. Implies lazy and requires all images to have the same
+        size.
+        :param workers: the number of threads decoding the images when
+        all of them are loaded at once.
+        :param reduce: if 2, 4 or 8, OpenCV images are decoded directly
+        as grayscale images reduced by this factor. Useful when the
+        slides are only needed for comparisons.
         """
         self.path = path
-        if image_type == "pil":
+        self.archive = None
+        if archive.is_archive(path):
+            # the images of archives are always decoded with OpenCV
+            self.archive = archive.SlideArchive(path, reduced_grayscale_flag(reduce))
+            self.imgreader = self.archive
+        elif image_type == "pil":
             self.imgreader = PILReader()
         else:
-            self.imgreader = OpenCVReader()
+            self.imgreader = OpenCVReader(reduced_grayscale_flag(reduce))
+        self.lazy = lazy or mmap
+        self.cache_size = cache_size
+        self.mmap = False
+        if image_type != "pil" and self.archive is None:
+            self.mmap = mmap
+        self.workers = workers
+        self.reduce = reduce
+        self.lazy_slides = []
 
     def get_slides(self):
         """
@@ -62,17 +251,94 @@ class SlideDataHelper(object):
         objects.
         :return: The slides stored on disk as list of "Slide" objects.
         """
-        slides = []
+        if self.lazy:
+            files = list(self.get_files())
+            slides = LazySlides(files, self.imgreader, self.cache_size, self.mmap_path(), self.mmap is True)
+            for slide, (_, key) in zip(slides, files):
+                slide.times = self.get_times(key)
+            self.lazy_slides.append(slides)
+            return slides
+        if self.workers > 1:
+            files = list(self.get_files())
+            pool = ThreadPool(self.workers)
+            try:
+                # OpenCV releases the GIL while decoding
+                imgs = pool.map(self.imgreader.get_img, [file_path for _, file_path in files])
+            finally:
+                pool.close()
+                pool.join()
+            return [self.create_slide(time, key, img) for (time, key), img in zip(files, imgs)]
+        return list(self.iter_slides())
+
+    def mmap_path(self):
+        """
+        Returns where the memory mapped file of the slides is stored.
+        Files in a cache directory are named after the path of the
+        slides, temporary files get a directory of their own.
+        :return: the path of the file or None if mmap is disabled
+        """
+        if not self.mmap:
+            return None
+        name = MMAP_NAME % ('' if self.reduce in (None, 1) else '-%d' % self.reduce)
+        if self.mmap is True:
+            return os.path.join(tempfile.mkdtemp(prefix='slides'), name)
+        mediaoutput.setup_dirs(os.path.join(self.mmap, name))
+        key = hashlib.sha1(os.path.abspath(self.path)).hexdigest()[:16]
+        return os.path.join(self.mmap, key + '-' + name)
+
+    def close(self):
+        """
+        Closes the lazy slides returned by get_slides, which removes
+        their temporary files, and the slide archive.
+        """
+        for slides in self.lazy_slides:
+            slides.close()
+        self.lazy_slides = []
+        if self.archive is not None:
+            self.archive.close()
+
+    def iter_slides(self):
+        """
+        Same as get_slides, but reads each slide from disk only when
+        the previous one has been consumed.
+        :return: generator of the slides stored on disk
+        """
+        for time, file_path in self.get_files():
+            yield self.create_slide(time, file_path, self.imgreader.get_img(file_path))
+
+    def create_slide(self, time, key, img):
+        slide = Slide(time, img)
+        slide.times = self.get_times(key)
+        return slide
+
+    def get_times(self, key):
+        """
+        Returns the additional appearances of a slide. Only slide
+        archives store them.
+        :param key: the file path or the index in the archive
+        :return: the list of additional timestamps
+        """
+        if self.archive is None:
+            return []
+        return self.archive.get_times(key)[1:]
+
+    def get_files(self):
+        """
+        Lists the images in the path in their numerical order. For slide
+        archives the index of the image is listed instead of the path.
+        :return: generator of (time, file path) tuples
+        """
+        if self.archive is not None:
+            for i in xrange(len(self.archive)):
+                yield self.archive.get_times(i)[0], i
+            return
         for filename in sorted(os.listdir(self.path), key=numericalSort):
             file_path = os.path.join(self.path, filename)
             _, ext = os.path.splitext(file_path)
             if not is_image(ext):
                 continue
             time, _ = os.path.splitext(filename)
-            slide = Slide(time, self.imgreader.get_img(file_path))
-            slides.append(slide)
-
-        return slides
+            yield time, file_path
 
 
 class ImageReader(object):
@@ -89,8 +355,34 @@ class PILReader(ImageReader):
 
 
 class OpenCVReader(ImageReader):
+    def __init__(self, flags=cv2.IMREAD_COLOR):
+        """
+        Default initializer
+        :param flags: the flags passed to cv2.imread
+        """
+        self.flags = flags
+
     def get_img(self, file_path):
-        return cv2.imread(file_path)
+        return cv2.imread(file_path, self.flags)
+
+
+def reduced_grayscale_flag(factor):
+    """
+    Returns the imread flag for decoding a grayscale image reduced by
+    the given factor.
+    :param factor: None, 1, 2, 4 or 8
+    :return: the flag for cv2.imread
+    """
+    if factor is None or factor == 1:
+        return cv2.IMREAD_COLOR
+    flags = {
+        2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+        4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+        8: cv2.IMREAD_REDUCED_GRAYSCALE_8
+    }
+    if factor not in flags:
+        raise ValueError("the reduction factor has to be 2, 4 or 8, not %s" % factor)
+    return flags[factor]
 
 
 def convert_to_opencv(img):
@@ -107,4 +399,4 @@ def is_image(ext):
     :param ext: the extension of a file.
     :return: whether or not the file is a image
     """
-    return ext == '.jpeg' or ext == '.png' or ext == '.jpg' or ext == '.bmp'
+    return ext == '.jpeg' or ext == '.png' or ext == '.jpg' or ext == '.bmp' or ext == '.webp'
@@ -2,7 +2,10 @@ import cv2
 import os
 import mediaoutput
 import imgcomparison as ic
+import imgprocessor
 import argparse
+import archive
+import imghash
 import sources
 import ui
 from slides import SlideDataHelper
@@ -14,20 +17,45 @@ class SlideSorter(Analyzer):
     Sorts the slides according to their timestamp.
     """
 
-    def __init__(self, source, outpath=None, timetable_loc=None, file_format=".png", comparator=ic.AbsDiffHistComparator(0.99)):
+    def __init__(self, source, outpath=None, timetable_loc=None, file_format=".png", comparator=ic.AbsDiffHistComparator(0.99),
+                 hash_radius=None, write_workers=0, encoding_params=None, region=None, fingerprint=None):
         """
         Default initializer
         :param path: the path where the slides are located on disk
         :param comparator: the comparator to determine, if two slides
         are duplicates.
+        :param hash_radius: if given, the slides are indexed by their
+        perceptual hash and only the slides whose hash differs in at
+        most this many bits are compared with the comparator.
+        :param write_workers: the number of threads writing the sorted
+        slides in the background. 0 writes them synchronously.
+        :param encoding_params: the OpenCV encoding parameters of the
+        written slides, see mediaoutput.encoding_params
+        :param region: the region of the slides as (x, y, width, height)
+        tuple that is compared. None compares the whole slides.
+        :param fingerprint: optional (width, height) tuple. If given,
+        the unique slides are kept and compared downscaled to this
+        size, so that the memory does not grow with the resolution of
+        the slides. None keeps and compares them in full resolution.
         """
+        self.region = region
+        self.processors = imgprocessor.ImageProcessQueue()
+        if region is not None:
+            self.processors.add(imgprocessor.CropProcessor(region))
+        if fingerprint is not None:
+            self.processors.add(imgprocessor.ResizeProcessor(fingerprint))
         self.comparator = comparator
+        self.hash_radius = hash_radius
         self.writer = mediaoutput.NullWriter()
-        if outpath is not None:
+        if archive.is_archive(outpath):
+            # the archive keeps the appearances of each slide itself
+            self.writer = archive.TimetableArchiveWriter(outpath, file_format, encoding_params)
+        elif outpath is not None:
             if timetable_loc is None:
                 timetable_loc = os.path.join(outpath, 'timetable.txt')
             self.file_format = file_format
-            self.writer = mediaoutput.TimetableWriter(outpath, timetable_loc, self.file_format)
+            self.writer = mediaoutput.TimetableWriter(outpath, timetable_loc, self.file_format, write_workers,
+                                                      encoding_params)
         self.source = source
 
     def sort(self):
@@ -48,41 +76,63 @@ class SlideSorter(Analyzer):
 
     def group_slides(self):
         """
-        Groups the slides by eliminating duplicates.
-        :param slides: the list of slides possibly containing duplicates
-        :return: a list of slides without duplicates
+        Groups the slides by eliminating duplicates. Only the
+        fingerprints and the appearances of the unique slides are kept,
+        each unique slide is written as soon as it is found.
+        :return: generator of the position and the slide, which is
+        None for duplicates
         """
-        slides = []
-        sorted_slides = []
+        # the fingerprint and the appearances of each unique slide
+        candidates = []
+        index = None
+        if self.hash_radius is not None:
+            index = imghash.BKTree()
         loop_counter = 0
         page_counter = 1
         for slide in self.source.contents():
-            slides.append(slide)
             if slide.marked:
                 continue
-            found = False
-            for other in slides[:-1]:
-                if self.comparator.are_same(slide.img, other.img):
-                    found = True
-                    if other.marked:
-                        other.reference.add_time(slide.time)
-                        slide.reference = other.reference
-                        slide.marked = True
-                    else:
-                        slide.reference = other
-                        other.add_time(slide.time)
-                        slide.marked = True
-                    yield loop_counter, None
-
-            if not found:
+            fprint = self.processors.apply(slide.img)
+            other = self.find_duplicate(fprint, candidates, index)
+            if other is not None:
+                other.append(slide.time)
+                slide.marked = True
+                yield loop_counter, None
+            else:
+                candidates.append((fprint.copy(), slide.times))
                 slide.page_number = page_counter
+                self.writer.write([slide])
                 yield loop_counter, slide
-                sorted_slides.append(slide)
                 page_counter += 1
             loop_counter += 1
-        self.writer.write(sorted_slides)
         self.writer.close()
 
+    def find_duplicate(self, fprint, candidates, index=None):
+        """
+        Searches the earliest unique slide that is the same as the
+        given slide.
+        :param fprint: the fingerprint of the slide to look for
+        :param candidates: the list of fingerprint and appearances
+        tuples of the unique slides
+        :param index: an optional BKTree of the hashes of the unique
+        slides. The hash of the slide is added to it, if it is unique.
+        :return: the appearances of the duplicate or None if there is
+        none
+        """
+        positions = xrange(len(candidates))
+        key = None
+        if index is not None:
+            key = imghash.dhash(fprint)
+            positions = sorted(index.search(key, self.hash_radius))
+
+        for i in positions:
+            other, times = candidates[i]
+            if self.comparator.are_same(fprint, other):
+                return times
+        if key is not None:
+            index.add(key, len(candidates))
+        return None
+
     def analyze(self):
         for _, slide in self.group_slides():
             if slide is None:
@@ -100,9 +150,33 @@ if __name__ == '__main__':
     Parser.add_argument("-t", "--timetable",
                         help="path where the timetable should be written (default is the outpath+'timetable.txt')",
                         nargs='?', default=None)
+    Parser.add_argument("-r", "--hash-radius",
+                        help="only compare slides whose perceptual hashes differ in at most this many bits",
+                        type=int, default=None)
+    Parser.add_argument("--lazy", help="decode the slides only when they are accessed", action="store_true")
+    Parser.add_argument("--mmap", help="keep the decoded slides in memory mapped files, in DIR for later runs "
+                                       "or temporary ones", nargs='?', const=True, default=False, metavar="DIR")
+    Parser.add_argument("-w", "--workers", help="number of threads decoding the slides", type=int, default=1)
+    Parser.add_argument("--write-workers", help="number of threads writing the slides in the background",
+                        type=int, default=0)
+    Parser.add_argument("-c", "--compression", help="PNG compression level from 0 (fastest) to 9 (smallest)",
+                        type=int, default=None)
+    Parser.add_argument("-q", "--quality", help="JPEG or WebP quality from 0 to 100", type=int, default=None)
+    Parser.add_argument("--region", help="region of the slides compared as 'x,y,width,height'",
+                        type=imgprocessor.parse_fixed_region, default=None)
+    Parser.add_argument("--fingerprint", help="keep and compare the slides downscaled to this size e.g. '320x180'",
+                        type=imgprocessor.parse_size, default=None)
     Args = Parser.parse_args()
-    if Args.timetable is None:
+    if Args.timetable is None and not archive.is_archive(Args.outpath):
         Args.timetable = os.path.join(Args.outpath, "timetable.txt")
 
-    sorter = SlideSorter(sources.ListSource(SlideDataHelper(Args.inputslides).get_slides()), Args.outpath, Args.timetable, Args.fileformat)
-    sorter.sort()
+    helper = SlideDataHelper(Args.inputslides, lazy=Args.lazy, mmap=Args.mmap, workers=Args.workers)
+    slides = helper.get_slides()
+    sorter = SlideSorter(sources.ListSource(slides), Args.outpath, Args.timetable, Args.fileformat,
+                         hash_radius=Args.hash_radius, write_workers=Args.write_workers,
+                         encoding_params=mediaoutput.encoding_params(Args.fileformat, Args.compression, Args.quality),
+                         region=Args.region, fingerprint=Args.fingerprint)
+    try:
+        sorter.sort()
+    finally:
+        helper.close()
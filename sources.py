@@ -1,5 +1,7 @@
 from abc import ABCMeta, abstractmethod
+import Queue
 import sys
+import threading
 
 
 class Source(object):
@@ -30,3 +32,66 @@ class AnalyzerSource(Source):
     def contents(self):
         for content in self.analyzer.analyze():
             yield content
+
+
+class BufferedSource(Source):
+    """
+    Reads the contents of another source in a background thread into a
+    bounded buffer. This way the producing analyzer keeps working while
+    the consumer processes the previous contents, without holding more
+    than the buffer size in memory.
+    """
+    def __init__(self, source, size=4):
+        """
+        Default initializer
+        :param source: the source that should be read ahead
+        :param size: the maximum number of contents in the buffer
+        """
+        self.source = source
+        self.size = size
+
+    def contents(self):
+        buffer = Queue.Queue(maxsize=self.size)
+        stopped = threading.Event()
+        worker = threading.Thread(target=self.produce, args=(buffer, stopped))
+        worker.daemon = True
+        worker.start()
+        try:
+            while True:
+                done, content = buffer.get()
+                if done:
+                    if content is not None:
+                        raise content
+                    return
+                yield content
+        finally:
+            stopped.set()
+            worker.join()
+
+    def produce(self, buffer, stopped):
+        """
+        Fills the buffer with the contents of the source. The end of the
+        source is marked with (True, None), an error with (True, error).
+        :param buffer: the queue receiving the contents
+        :param stopped: the event signaling that the consumer stopped
+        """
+        item = (True, None)
+        try:
+            for content in self.source.contents():
+                if not self.put(buffer, stopped, (False, content)):
+                    return
+        except Exception as e:
+            item = (True, e)
+        self.put(buffer, stopped, item)
+
+    def put(self, buffer, stopped, item):
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def __len__(self):
+        return len(self.source)
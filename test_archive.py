@@ -0,0 +1,92 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import archive
+import imghash
+import mediaoutput
+from slides import Slide, SlideDataHelper
+
+
+class ArchiveRoundTripTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'slides.slar')
+        random = np.random.RandomState(0)
+        self.imgs = [random.randint(0, 256, (36, 64, 3)).astype(np.uint8) for _ in xrange(3)]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_is_archive(self):
+        self.assertTrue(archive.is_archive('out/lecture.SLAR'))
+        self.assertFalse(archive.is_archive('out/'))
+        self.assertFalse(archive.is_archive(None))
+
+    def test_add(self):
+        writer = archive.SlideArchiveWriter(self.path)
+        writer.add(self.imgs[0], '0:00:00.000', 0)
+        writer.add(self.imgs[1], '0:00:04.000', 100, ['0:00:12.000'])
+        writer.add(mediaoutput.encode(self.imgs[2], '.png'), '0:00:08.000', 200)
+        writer.close()
+
+        slides = archive.SlideArchive(self.path)
+        try:
+            self.assertEqual(len(slides), 3)
+            self.assertEqual(slides.file_format, '.png')
+            for i, img in enumerate(self.imgs):
+                # PNG is lossless
+                self.assertTrue(np.array_equal(slides.get_img(i), img))
+                self.assertEqual(slides.get_fingerprint(i), imghash.dhash(img))
+            self.assertEqual([slides.get_frame(i) for i in xrange(3)], [0, 100, 200])
+            self.assertEqual(slides.get_times(1), ['0:00:04.000', '0:00:12.000'])
+            self.assertEqual(slides.get_encoded(2).data, mediaoutput.encode(self.imgs[2], '.png').data)
+        finally:
+            slides.close()
+
+    def test_write_frames(self):
+        writer = archive.SlideArchiveWriter(self.path, fps=25, file_format='png')
+        writer.write(self.imgs[0], 0)
+        writer.write(self.imgs[1], 50)
+        writer.close()
+        slides = archive.SlideArchive(self.path)
+        try:
+            self.assertEqual([slides.get_times(i) for i in xrange(2)], [['0:00:00.000'], ['0:00:02.000']])
+            self.assertEqual([slides.get_frame(i) for i in xrange(2)], [0, 50])
+        finally:
+            slides.close()
+
+    def test_timetable(self):
+        slides = [Slide('0:00:00.000', self.imgs[0]), Slide('0:00:04.000', self.imgs[1])]
+        writer = archive.TimetableArchiveWriter(self.path)
+        writer.write(slides)
+        # duplicates found after the slide has been written still count
+        slides[0].add_time('0:00:08.000')
+        duplicate = Slide('0:00:12.000', self.imgs[1])
+        duplicate.marked = True
+        writer.write([duplicate])
+        writer.close()
+
+        helper = SlideDataHelper(self.path)
+        try:
+            read = helper.get_slides()
+            self.assertEqual([slide.time for slide in read], ['0:00:00.000', '0:00:04.000'])
+            self.assertEqual([slide.times for slide in read], [['0:00:08.000'], []])
+            for slide, img in zip(read, self.imgs):
+                self.assertTrue(np.array_equal(slide.img, img))
+        finally:
+            helper.close()
+
+    def test_incomplete(self):
+        writer = archive.SlideArchiveWriter(self.path)
+        writer.add(self.imgs[0], '0:00:00.000')
+        writer.archive.close()
+        self.assertRaises(IOError, archive.SlideArchive, self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import unittest
+
+import numpy as np
+
+import imgcomparison as ic
+
+
+class BufferedAbsDiffComparatorTest(unittest.TestCase):
+    """
+    The BufferedAbsDiffComparator has to decide exactly like the
+    AbsDiffHistComparator it replaces.
+    """
+
+    def setUp(self):
+        self.random = np.random.RandomState(42)
+
+    def pairs(self, shape, count=20):
+        """
+        Returns pairs of random images that differ in a random share of
+        their pixels by random amounts around the threshold of 15.
+        """
+        for _ in xrange(count):
+            first = self.random.randint(0, 256, shape).astype(np.uint8)
+            second = first.astype(np.int16)
+            changed = self.random.rand(*shape) < self.random.rand() * 0.05
+            second[changed] += self.random.randint(-30, 31, shape)[changed]
+            yield first, np.clip(second, 0, 255).astype(np.uint8)
+
+    def assert_agree(self, pairs, threshold=0.99):
+        reference = ic.AbsDiffHistComparator(threshold)
+        buffered = ic.BufferedAbsDiffComparator(threshold)
+        for first, second in pairs:
+            self.assertEqual(reference.are_similar(first, second), buffered.are_similar(first, second))
+            self.assertEqual(reference.are_same(first, second), buffered.are_same(first, second))
+
+    def test_color(self):
+        self.assert_agree(self.pairs((48, 64, 3)))
+
+    def test_grayscale(self):
+        self.assert_agree(self.pairs((48, 64)))
+
+    def test_thresholds(self):
+        for threshold in (0.9, 0.97, 0.995):
+            self.assert_agree(self.pairs((30, 40, 3), 10), threshold)
+
+    def test_cropped(self):
+        self.assert_agree((first[5:37, 7:50], second[5:37, 7:50]) for first, second in self.pairs((48, 64, 3)))
+
+    def test_strided(self):
+        self.assert_agree((first[::2, ::3], second[::2, ::3]) for first, second in self.pairs((48, 64, 3)))
+        self.assert_agree((first[1::2, ::2], second[1::2, ::2]) for first, second in self.pairs((48, 64)))
+
+    def test_reused_buffers(self):
+        # the buffers of the previous comparison must not leak into the
+        # next one, also when the shape changes in between
+        shapes = [(48, 64, 3), (48, 64, 3), (48, 64), (24, 32, 3), (48, 64, 3)]
+        pairs = [pair for shape in shapes for pair in self.pairs(shape, 5)]
+        self.assert_agree(pairs)
+
+    def test_identical(self):
+        img = self.random.randint(0, 256, (48, 64, 3)).astype(np.uint8)
+        comparator = ic.BufferedAbsDiffComparator(0.99)
+        self.assertEqual(comparator.are_similar(img, img.copy()), 1)
+        self.assertTrue(comparator.are_same(img, img.copy()))
+
+
+class FeatureCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = 0
+
+    def compute(self, img):
+        self.calls += 1
+        return img.sum()
+
+    def test_views_are_found_again(self):
+        cache = ic.FeatureCache()
+        img = np.arange(48, dtype=np.uint8).reshape(6, 8)
+        self.assertEqual(cache.get(img[1:4, 2:6], self.compute), img[1:4, 2:6].sum())
+        # a new view of the same location hits the cache
+        self.assertEqual(cache.get(img[1:4, 2:6], self.compute), img[1:4, 2:6].sum())
+        self.assertEqual(self.calls, 1)
+
+    def test_views_at_other_locations(self):
+        cache = ic.FeatureCache()
+        img = np.arange(48, dtype=np.uint8).reshape(6, 8)
+        views = [img[1:4, 2:6], img[2:5, 2:6], img[1:4, 2:5], img[1:4:2, 2:6], img[1:4, 2:6:2]]
+        for view in views:
+            self.assertEqual(cache.get(view, self.compute), view.sum())
+        self.assertEqual(self.calls, len(views))
+
+    def test_other_arrays(self):
+        cache = ic.FeatureCache()
+        first = np.zeros((4, 4), np.uint8)
+        second = np.ones((4, 4), np.uint8)
+        self.assertEqual(cache.get(first, self.compute), 0)
+        self.assertEqual(cache.get(second, self.compute), 16)
+        self.assertEqual(self.calls, 2)
+
+    def test_replaced_owner(self):
+        # a new array at the address of a collected one is not mistaken
+        # for it
+        cache = ic.FeatureCache()
+        for value in xrange(20):
+            img = np.full((4, 4), value, np.uint8)
+            self.assertEqual(cache.get(img, self.compute), 16 * value)
+            del img
+        self.assertEqual(self.calls, 20)
+
+    def test_size(self):
+        cache = ic.FeatureCache(size=2)
+        imgs = [np.full((2, 2), value, np.uint8) for value in xrange(3)]
+        for img in imgs:
+            cache.get(img, self.compute)
+        self.assertEqual(len(cache.entries), 2)
+        cache.get(imgs[0], self.compute)
+        self.assertEqual(self.calls, 4)
+        cache = ic.FeatureCache(size=0)
+        cache.get(imgs[0], self.compute)
+        self.assertEqual(len(cache.entries), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
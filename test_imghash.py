@@ -0,0 +1,60 @@
+import unittest
+
+import cv2
+import numpy as np
+
+import imghash
+
+
+class HashTest(unittest.TestCase):
+
+    def test_hamming(self):
+        self.assertEqual(imghash.hamming(0, 0), 0)
+        self.assertEqual(imghash.hamming(0b1011, 0b0010), 2)
+        self.assertEqual(imghash.hamming(2 ** 64 - 1, 0), 64)
+
+    def test_dhash(self):
+        random = np.random.RandomState(1)
+        img = random.randint(0, 256, (90, 160, 3)).astype(np.uint8)
+        key = imghash.dhash(img)
+        self.assertLess(key, 2 ** 64)
+        # a color image hashes like its grayscale version
+        self.assertEqual(imghash.dhash(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)), key)
+        gradient = np.tile(np.arange(0, 256, 2, dtype=np.uint8), (64, 1))
+        self.assertEqual(imghash.dhash(gradient), 2 ** 64 - 1)
+        self.assertEqual(imghash.dhash(gradient[:, ::-1]), 0)
+
+
+class BKTreeTest(unittest.TestCase):
+
+    def test_empty(self):
+        self.assertEqual(imghash.BKTree().search(0, 64), [])
+
+    def test_search_against_brute_force(self):
+        random = np.random.RandomState(2)
+        keys = [int(random.randint(0, 2 ** 16)) for _ in xrange(300)]
+        # near duplicates of some of the keys
+        keys += [key ^ (1 << int(random.randint(0, 16))) for key in keys[:50]]
+        tree = imghash.BKTree()
+        for value, key in enumerate(keys):
+            tree.add(key, value)
+        for key in keys[:40] + [int(random.randint(0, 2 ** 16)) for _ in xrange(20)]:
+            for radius in (0, 1, 3, 6):
+                expected = [value for value, other in enumerate(keys) if imghash.hamming(key, other) <= radius]
+                self.assertEqual(sorted(tree.search(key, radius)), expected)
+
+    def test_duplicate_keys(self):
+        tree = imghash.BKTree()
+        for value in xrange(3):
+            tree.add(42, value)
+        self.assertEqual(sorted(tree.search(42, 0)), [0, 1, 2])
+
+    def test_custom_distance(self):
+        tree = imghash.BKTree(lambda first, second: abs(first - second))
+        for value in (1, 4, 9, 16, 25):
+            tree.add(value, value)
+        self.assertEqual(sorted(tree.search(10, 6)), [4, 9, 16])
+
+
+if __name__ == '__main__':
+    unittest.main()
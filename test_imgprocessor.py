@@ -0,0 +1,107 @@
+import argparse
+import unittest
+
+import numpy as np
+
+import imgprocessor
+
+
+class ParseSizeTest(unittest.TestCase):
+
+    def test_size(self):
+        self.assertEqual(imgprocessor.parse_size('160x90'), (160, 90))
+        self.assertEqual(imgprocessor.parse_size('320X180'), (320, 180))
+
+    def test_full(self):
+        self.assertIsNone(imgprocessor.parse_size('full'))
+
+    def test_invalid(self):
+        for size in ('160', '160x', 'x90', '160x90x3', 'axb'):
+            self.assertRaises(ValueError, imgprocessor.parse_size, size)
+
+
+class ParseRegionTest(unittest.TestCase):
+
+    def test_region(self):
+        self.assertEqual(imgprocessor.parse_region('10,20,640,360'), (10, 20, 640, 360))
+        self.assertEqual(imgprocessor.parse_fixed_region('0,0,1280,720'), (0, 0, 1280, 720))
+
+    def test_auto(self):
+        self.assertEqual(imgprocessor.parse_region('auto'), 'auto')
+        self.assertRaises(argparse.ArgumentTypeError, imgprocessor.parse_fixed_region, 'auto')
+
+    def test_invalid(self):
+        for region in ('10,20,640', '10,20,640,360,1', 'a,b,c,d'):
+            self.assertRaises(ValueError, imgprocessor.parse_region, region)
+            self.assertRaises(ValueError, imgprocessor.parse_fixed_region, region)
+
+    def test_argparse(self):
+        parser = argparse.ArgumentParser()
+        parser.add_argument('--region', type=imgprocessor.parse_fixed_region)
+        self.assertEqual(parser.parse_args(['--region', '1,2,3,4']).region, (1, 2, 3, 4))
+        parser.error = self.fail_parsing
+        self.assertRaises(ValueError, parser.parse_args, ['--region', 'auto'])
+
+    def fail_parsing(self, message):
+        raise ValueError(message)
+
+
+class DetectSlideRegionTest(unittest.TestCase):
+
+    def frames(self, width, height, inset=None, count=40):
+        """
+        Yields frames of a slide that changes every 10 frames and of an
+        optional inset with noise in every frame.
+        """
+        random = np.random.RandomState(0)
+        for i in xrange(count):
+            frame = np.full((height, width, 3), 60 + 40 * (i // 10), np.uint8)
+            if inset is not None:
+                x, y, w, h = inset
+                frame[y:y + h, x:x + w] = random.randint(0, 256, (h, w, 3))
+            yield frame
+
+    def test_inset_right(self):
+        region = imgprocessor.detect_slide_region(self.frames(1280, 720, (960, 540, 320, 180)))
+        x, y, width, height = region
+        # the region lies left of the inset and is only cut by the
+        # dilation around it
+        self.assertEqual((x, y, height), (0, 0, 720))
+        self.assertTrue(900 <= width <= 960)
+
+    def test_inset_left(self):
+        x, y, width, height = imgprocessor.detect_slide_region(self.frames(1920, 1080, (0, 0, 400, 300)))
+        self.assertEqual((y, height), (0, 1080))
+        self.assertTrue(400 <= x <= 440)
+        self.assertEqual(x + width, 1920)
+
+    def test_without_inset(self):
+        self.assertEqual(imgprocessor.detect_slide_region(self.frames(640, 360)), (0, 0, 640, 360))
+
+    def test_small_frames(self):
+        # frames narrower than the downscaled width are used as they are
+        x, y, width, height = imgprocessor.detect_slide_region(self.frames(200, 100, (150, 0, 50, 40)))
+        self.assertEqual((x, y, height), (0, 0, 100))
+        self.assertTrue(135 <= width <= 150)
+
+    def test_grayscale(self):
+        frames = (frame[:, :, 0] for frame in self.frames(1280, 720, (960, 540, 320, 180)))
+        self.assertEqual(imgprocessor.detect_slide_region(frames),
+                         imgprocessor.detect_slide_region(self.frames(1280, 720, (960, 540, 320, 180))))
+
+    def test_too_few_frames(self):
+        self.assertIsNone(imgprocessor.detect_slide_region(iter([])))
+        self.assertEqual(imgprocessor.detect_slide_region(self.frames(640, 360, count=2)), (0, 0, 640, 360))
+
+
+class FingerprintTest(unittest.TestCase):
+
+    def test_resize_and_grayscale(self):
+        img = np.random.RandomState(0).randint(0, 256, (720, 1280, 3)).astype(np.uint8)
+        queue = imgprocessor.ImageProcessQueue([imgprocessor.ResizeProcessor((160, 90)),
+                                                imgprocessor.GrayscaleProcessor()])
+        self.assertEqual(queue.apply(img).shape, (90, 160))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+
+import numpy as np
+
+import imgcomparison as ic
+from levenshtein import distance, matrix_distance
+
+
+def equality(s, t):
+    return np.array([[a == b for b in t] for a in s], dtype=bool).reshape(len(s), len(t))
+
+
+def table_distance(s, t):
+    """
+    The textbook dynamic programming solution with the full table.
+    """
+    dist = [[i + j if i == 0 or j == 0 else 0 for j in xrange(len(t) + 1)] for i in xrange(len(s) + 1)]
+    for i in xrange(1, len(s) + 1):
+        for j in xrange(1, len(t) + 1):
+            dist[i][j] = min(dist[i - 1][j] + 1, dist[i][j - 1] + 1, dist[i - 1][j - 1] + (s[i - 1] != t[j - 1]))
+    return dist[len(s)][len(t)]
+
+
+class MatrixDistanceTest(unittest.TestCase):
+
+    def test_known_distances(self):
+        self.assertEqual(matrix_distance(equality('kitten', 'sitting')), 3)
+        self.assertEqual(matrix_distance(equality('flaw', 'lawn')), 2)
+        self.assertEqual(matrix_distance(equality('same', 'same')), 0)
+
+    def test_empty(self):
+        self.assertEqual(matrix_distance(equality('', '')), 0)
+        self.assertEqual(matrix_distance(equality('abc', '')), 3)
+        self.assertEqual(matrix_distance(equality('', 'ab')), 2)
+
+    def test_random_against_table(self):
+        random = np.random.RandomState(7)
+        for _ in xrange(50):
+            s = list(random.randint(0, 4, random.randint(0, 12)))
+            t = list(random.randint(0, 4, random.randint(0, 12)))
+            self.assertEqual(matrix_distance(equality(s, t)), table_distance(s, t))
+
+    def test_band(self):
+        random = np.random.RandomState(3)
+        for _ in xrange(50):
+            s = list(random.randint(0, 3, random.randint(1, 12)))
+            t = list(random.randint(0, 3, random.randint(1, 12)))
+            equal = equality(s, t)
+            exact = matrix_distance(equal)
+            for band in (0, 1, 2):
+                # a band only rules out alignments, it never finds shorter ones
+                self.assertGreaterEqual(matrix_distance(equal, band), exact)
+            self.assertEqual(matrix_distance(equal, max(len(s), len(t))), exact)
+
+    def test_path(self):
+        random = np.random.RandomState(11)
+        for _ in xrange(30):
+            s = list(random.randint(0, 3, random.randint(0, 10)))
+            t = list(random.randint(0, 3, random.randint(0, 10)))
+            result, alignment = matrix_distance(equality(s, t), path=True)
+            self.assertEqual(result, matrix_distance(equality(s, t)))
+            # the alignment visits every element once and in order
+            self.assertEqual([i for i, _ in alignment if i is not None], range(len(s)))
+            self.assertEqual([j for _, j in alignment if j is not None], range(len(t)))
+            cost = sum(1 for i, j in alignment if i is None or j is None or s[i] != t[j])
+            self.assertEqual(cost, result)
+
+
+class DistanceTest(unittest.TestCase):
+
+    def test_equality(self):
+        self.assertEqual(distance('kitten', 'sitting'), 3)
+
+    def test_comparator(self):
+        random = np.random.RandomState(5)
+        slides = [random.randint(0, 256, (20, 30)).astype(np.uint8) for _ in xrange(4)]
+        source = [slides[0], slides[1], slides[2], slides[1]]
+        reference = [slides[0].copy(), slides[2].copy(), slides[1].copy(), slides[3]]
+        # the second slide is deleted and the fourth slide inserted
+        self.assertEqual(distance(source, reference, ic.AbsDiffHistComparator(0.99)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
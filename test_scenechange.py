@@ -0,0 +1,80 @@
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+import scenechange
+
+HEADER = """Input #0, mpegts, from 'lecture.ts':
+  Duration: 00:01:00.00, start: 1.400000, bitrate: 1000 kb/s
+  Stream #0:0[0x100]: Video: h264 (High), yuv420p, 1280x720, 25 fps
+"""
+
+FRAMES = """[Parsed_showinfo_2 @ 0x1] n:   0 pts: 306000 pts_time:3.4     pos: 1 fmt:yuv420p
+[Parsed_showinfo_2 @ 0x1] n:   1 pts: 135000 pts_time:1.5     pos: 2 fmt:yuv420p
+[Parsed_showinfo_2 @ 0x1] n:   2 pts:1008000 pts_time:11.2    pos: 3 fmt:yuv420p
+"""
+
+
+class SceneChangesTest(unittest.TestCase):
+    """
+    Runs scene_changes against a fake ffmpeg that prints the given
+    output on stderr.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def ffmpeg(self, output, status=0):
+        output_path = os.path.join(self.directory, 'output.txt')
+        with open(output_path, 'w') as output_file:
+            output_file.write(output)
+        path = os.path.join(self.directory, 'ffmpeg')
+        with open(path, 'w') as script:
+            script.write("#!/bin/sh\ncat '%s' >&2\nexit %d\n" % (output_path, status))
+        os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+        return path
+
+    def test_times_relative_to_start(self):
+        times = scenechange.scene_changes('lecture.ts', ffmpeg=self.ffmpeg(HEADER + FRAMES))
+        self.assertEqual([round(time, 6) for time in times], [0.1, 2.0, 9.8])
+
+    def test_no_start_time(self):
+        header = HEADER.replace(', start: 1.400000', '')
+        times = scenechange.scene_changes('lecture.ts', ffmpeg=self.ffmpeg(header + FRAMES))
+        self.assertEqual(times, [1.5, 3.4, 11.2])
+
+    def test_negative_start_time(self):
+        header = HEADER.replace('start: 1.400000', 'start: -0.500000')
+        times = scenechange.scene_changes('lecture.ts', ffmpeg=self.ffmpeg(header + FRAMES))
+        self.assertEqual([round(time, 6) for time in times], [2.0, 3.9, 11.7])
+
+    def test_no_scene_changes(self):
+        self.assertEqual(scenechange.scene_changes('lecture.ts', ffmpeg=self.ffmpeg(HEADER)), [])
+
+    def test_failure(self):
+        ffmpeg = self.ffmpeg(HEADER + "lecture.ts: Invalid data found when processing input\n", 1)
+        with self.assertRaises(IOError) as context:
+            scenechange.scene_changes('lecture.ts', ffmpeg=ffmpeg)
+        self.assertIn('Invalid data found', str(context.exception))
+
+
+class CandidateFramesTest(unittest.TestCase):
+
+    def test_rounding(self):
+        self.assertEqual(scenechange.candidate_frames([0.1, 2.0, 9.8], 25), [2, 50, 245])
+        self.assertEqual(scenechange.candidate_frames([1.0 / 30, 0.05], 30), [1, 2])
+
+    def test_sorted_and_distinct(self):
+        self.assertEqual(scenechange.candidate_frames([4.0, 1.0, 1.01, 4.0], 25), [25, 100])
+
+    def test_empty(self):
+        self.assertEqual(scenechange.candidate_frames([], 25), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
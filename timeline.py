@@ -1,6 +1,11 @@
 # -*- coding: utf-8 -*-
 
 import cv2
+import Queue
+import sys
+import threading
+
+from collections import OrderedDict
 
 
 class Timeline(object):
@@ -11,12 +16,21 @@ class Timeline(object):
     """
     reader_head = 0
 
-    def __init__(self, stream):
+    def __init__(self, stream, keyframe_interval=None, cache_size=16):
         """
         Default Initializer
         :param stream: the video stream from OpenCV
+        :param keyframe_interval: the approximate distance between two
+        keyframes in the stream. Skips spanning more frames than that
+        seek instead of grabbing each frame, as the decoder restarts at
+        the nearest keyframe anyway. If None, skips never seek.
+        :param cache_size: the number of randomly accessed frames that
+        are kept in memory.
         """
         self.stream = stream
+        self.keyframe_interval = keyframe_interval
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
         self.len = stream.get(cv2.CAP_PROP_FRAME_COUNT)
         self.fps = stream.get(cv2.CAP_PROP_FPS)
 
@@ -37,22 +51,95 @@ class Timeline(object):
 
         return frame
 
+    def read_into(self, buf):
+        """
+        Reads the next frame like next_frame, but decodes it into the
+        given buffer if it has the size of the frames, so that reading
+        a stream does not allocate a new image per frame.
+        :param buf: the buffer or None to allocate a new frame
+        :return: the frame, usually the buffer itself, or None at the
+        end of the stream
+        """
+        if buf is None:
+            return self.next_frame()
+        ret, frame = self.stream.read(buf)
+        self.reader_head += 1
+
+        if not ret:
+            return None
+
+        return frame
+
+    def skip(self, count=1):
+        """
+        Advances the reader head by the given amount of frames without
+        decoding them into images. The frames are only grabbed from the
+        stream, unless the skip spans more than the keyframe interval.
+        :param count: the number of frames to skip
+        :return: False if the end of the stream has been reached
+        """
+        if self.keyframe_interval is not None and count > self.keyframe_interval:
+            self.seek(self.reader_head + count)
+            return self.len <= 0 or self.reader_head < self.len
+
+        for _ in xrange(count):
+            ret = self.stream.grab()
+            self.reader_head += 1
+            if not ret:
+                return False
+        return True
+
+    def move_to(self, pos):
+        """
+        Moves the reader head to the given position. Positions ahead
+        of the reader head are reached by skipping, all others through
+        seeking.
+        :param pos: the position of the frame in the sequence
+        :return: False if the end of the stream has been reached
+        """
+        if pos < self.reader_head:
+            self.seek(pos)
+            return True
+        return self.skip(pos - self.reader_head)
+
+    def seek(self, pos):
+        """
+        Moves the reader head to the given position, so that the next
+        call of next_frame returns the frame at this position.
+        :param pos: the position of the frame in the sequence
+        """
+        assert pos >= 0
+        self.stream.set(cv2.CAP_PROP_POS_FRAMES, pos)
+        self.reader_head = pos
+
     def get_frame(self, pos):
         """
-        Returns the frame at the given position of the frame sequence
+        Returns the frame at the given position of the frame sequence.
+        Recently accessed frames are served from the cache, otherwise
+        the stream only seeks if the reader head is not already at the
+        requested position.
         :param pos: the position of the frame in the sequence
         :return: the frame at the specified position
         """
         assert pos >= 0
-        self.stream.set(cv2.CAP_PROP_POS_FRAMES, self.len - 1)
-        _, frame = self.stream.read()
-        self.reader_head = pos + 1
+        if pos in self.cache:
+            frame = self.cache.pop(pos)
+            self.cache[pos] = frame
+            return frame
+
+        self.move_to(pos)
+        frame = self.next_frame()
+        if frame is not None and self.cache_size > 0:
+            self.cache[pos] = frame
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
         return frame
 
     def get_frames(self, start, end):
         """
         Returns the list of frames at between the specified start and
-        end position in the frame sequence.
+        end position in the frame sequence. The stream seeks at most
+        once and decodes the range sequentially afterwards.
         :param start: Where the frame sequence should start
         :param end: Where the frame sequence should end
         :return: the frame sequence from start to end
@@ -66,9 +153,161 @@ class Timeline(object):
         return result
 
     def release_stream(self):
+        self.cache.clear()
         self.stream.release()
 
 
+class PrefetchTimeline(Timeline):
+    """
+    The PrefetchTimeline decodes the frames of the video stream in a
+    background thread into a bounded queue. Since OpenCV releases the
+    GIL while decoding, the decoding of the next frames overlaps with
+    the processing of the current one.
+    """
+
+    def __init__(self, stream, depth=8, keyframe_interval=None, cache_size=16):
+        """
+        Default Initializer
+        :param stream: the video stream from OpenCV
+        :param depth: the maximum number of frames decoded ahead
+        :param keyframe_interval: see Timeline
+        :param cache_size: see Timeline
+        """
+        super(PrefetchTimeline, self).__init__(stream, keyframe_interval, cache_size)
+        self.depth = depth
+        self.queue = None
+        self.stopped = None
+        self.worker = None
+        self.start_prefetch()
+
+    def start_prefetch(self):
+        """
+        Starts decoding frames from the current stream position on.
+        """
+        self.queue = Queue.Queue(maxsize=self.depth)
+        self.stopped = threading.Event()
+        self.worker = threading.Thread(target=self.prefetch, args=(self.queue, self.stopped))
+        self.worker.daemon = True
+        self.worker.start()
+
+    def stop_prefetch(self):
+        """
+        Stops the background thread and discards all prefetched frames.
+        """
+        if self.worker is None:
+            return
+        self.stopped.set()
+        self.worker.join()
+        self.worker = None
+
+    def prefetch(self, queue, stopped):
+        """
+        Reads frames into the queue until the stream ends or the
+        prefetching is stopped. The end of the stream is marked by
+        putting None into the queue, an error of the stream by putting
+        a PrefetchError that next_frame raises again.
+        :param queue: the queue receiving the frames
+        :param stopped: the event signaling the thread to stop
+        """
+        while not stopped.is_set():
+            try:
+                ret, frame = self.stream.read()
+                if not ret:
+                    frame = None
+            except Exception:
+                frame = PrefetchError(sys.exc_info())
+            while not stopped.is_set():
+                try:
+                    queue.put(frame, timeout=0.1)
+                    break
+                except Queue.Full:
+                    pass
+            if frame is None or isinstance(frame, PrefetchError):
+                return
+
+    def next_frame(self):
+        """
+        Takes the next frame from the queue. Errors of the background
+        thread are raised here.
+        :return: the frame or None at the end of the stream or after the
+        stream has been released
+        """
+        while True:
+            if self.worker is None or self.stopped.is_set():
+                return None
+            try:
+                frame = self.queue.get(timeout=0.1)
+                break
+            except Queue.Empty:
+                # the worker may have put its last item just before it
+                # finished
+                if not self.worker.is_alive() and self.queue.empty():
+                    raise IOError("the decoding of the frames stopped unexpectedly")
+
+        if isinstance(frame, PrefetchError):
+            # keep the error for all subsequent calls
+            self.queue.put(frame)
+            frame.reraise()
+
+        self.reader_head += 1
+
+        if frame is None:
+            # keep the end marker for all subsequent calls
+            self.queue.put(None)
+
+        return frame
+
+    def read_into(self, buf):
+        # the frames are decoded ahead into their own images already
+        return self.next_frame()
+
+    def skip(self, count=1):
+        """
+        Advances the reader head by the given amount of frames. As the
+        frames are already decoded in the background, they are taken
+        from the queue unless the skip spans more than the keyframe
+        interval.
+        :param count: the number of frames to skip
+        :return: False if the end of the stream has been reached
+        """
+        if self.keyframe_interval is not None and count > self.keyframe_interval:
+            return super(PrefetchTimeline, self).skip(count)
+
+        for _ in xrange(count):
+            if self.next_frame() is None:
+                return False
+        return True
+
+    def seek(self, pos):
+        self.stop_prefetch()
+        super(PrefetchTimeline, self).seek(pos)
+        self.start_prefetch()
+
+    def release_stream(self):
+        self.stop_prefetch()
+        super(PrefetchTimeline, self).release_stream()
+
+
+class PrefetchError(object):
+    """
+    Carries an error of the background thread of a PrefetchTimeline to
+    the thread reading the frames.
+    """
+
+    def __init__(self, exc_info):
+        """
+        Default initializer
+        :param exc_info: the sys.exc_info() of the error
+        """
+        self.exc_info = exc_info
+
+    def reraise(self):
+        """
+        Raises the error again with its original traceback.
+        """
+        raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+
+
 class SlidingWindow(object):
     """
     This class represents an adaptive sliding window. Meaning
@@ -155,7 +394,7 @@ class SlidingWindow(object):
         return self.timeline.get_frames(self.pos, self.pos + self.size)
 
     def get_frame(self, pos):
-        return self.timeline.get_frame(self.pos)
+        return self.timeline.get_frame(self.pos + pos)
 
     def get_start_frame(self):
         return self.timeline.get_frame(self.pos)